@@ -0,0 +1,103 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+########################################################################################################################
+#   Timing of the graph model steps over mol2 files of increasing size, for example
+#   python benchmarks/benchmark_graph_model.py                  chained copies of 117_ideal
+#   python benchmarks/benchmark_graph_model.py a.mol2 b.mol2    the first molecule of each file
+########################################################################################################################
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import networkx as nx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utility.GraphModel import BuildMolGraph  # noqa: E402
+from utility.MoleculeParser import read_mol2  # noqa: E402
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "molecular-unfolding-data")
+
+
+def write_chain(copies, save_path):
+    # copies of 117_ideal along x, C3 of each copy bonded to C4 of the next one
+    record = next(read_mol2(os.path.join(DATA_PATH, "117_ideal.mol2")))
+    atom_arrays = record["atom_arrays"]
+    bond_arrays = record["bond_arrays"]
+    n = len(atom_arrays["atom_id"])
+    lines = ["@<TRIPOS>MOLECULE", f"chain{copies}",
+             f" {n*copies} {len(bond_arrays['bond_id'])*copies+copies-1} 0 0 0", "SMALL", "NO_CHARGES", "",
+             "@<TRIPOS>ATOM"]
+    for c in range(copies):
+        for k in range(n):
+            lines.append(f"{k+1+c*n:7d} {atom_arrays['atom_name'][k]:<8s} {atom_arrays['x'][k]+12*c:10.4f} "
+                         f"{atom_arrays['y'][k]:10.4f} {atom_arrays['z'][k]:10.4f} {atom_arrays['atom_type'][k]:<6s} "
+                         f"1 {atom_arrays['subst_name'][k]} {atom_arrays['charge'][k]:.4f}")
+    lines.append("@<TRIPOS>BOND")
+    bond_id = 1
+    for c in range(copies):
+        for atom_1, atom_2, bond_type in zip(bond_arrays["atom1"], bond_arrays["atom2"], bond_arrays["bond_type"]):
+            lines.append(f"{bond_id:6d} {int(atom_1)+c*n:5d} {int(atom_2)+c*n:5d} {bond_type}")
+            bond_id = bond_id + 1
+        if c + 1 < copies:
+            lines.append(f"{bond_id:6d} {3+c*n:5d} {4+(c+1)*n:5d} 1")
+            bond_id = bond_id + 1
+    with open(save_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return save_path
+
+
+def time_graph_model(mol_file, repeat):
+    # best of repeat runs of each step of BuildMolGraph.__init__
+    record = next(read_mol2(mol_file))
+    bond_arrays = record["bond_arrays"]
+    atom_num = len(record["atom_arrays"]["atom_id"])
+    best = {}
+    for _ in range(repeat):
+        bond_graph = BuildMolGraph.__new__(BuildMolGraph)
+        bond_graph.df_bonds = bond_arrays
+        bond_graph.atom_num = atom_num
+        bond_graph.mol_g = nx.Graph()
+        times = [time.perf_counter()]
+        bond_graph.build_graph()
+        bond_graph.mol_ug = bond_graph.mol_g.to_undirected()
+        bond_graph.exclusion = bond_graph.build_exclusion()
+        times.append(time.perf_counter())
+        bond_graph.rb_list = bond_graph.build_rb()
+        times.append(time.perf_counter())
+        bond_graph.rb_data, bond_graph.rb_data_list = bond_graph.build_rb_data()
+        times.append(time.perf_counter())
+        for step, start, end in zip(["build_graph", "build_rb", "build_rb_data"], times[:-1], times[1:]):
+            best[step] = min(best.get(step, end - start), end - start)
+    return atom_num, len(bond_arrays["bond_id"]), len(bond_graph.rb_list), best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="time the graph model over mol2 files of increasing size")
+    parser.add_argument("mol_files", nargs="*",
+                        help="mol2 files, chained copies of 117_ideal if none")
+    parser.add_argument("--copies", type=int, nargs="+", default=[1, 2, 4, 8, 16],
+                        help="number of copies of 117_ideal of each generated molecule")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        mol_files = args.mol_files or [write_chain(copies, os.path.join(tmp_dir, f"chain{copies}.mol2"))
+                                       for copies in args.copies]
+        print(f"{'file':<24s} {'atoms':>6s} {'bonds':>6s} {'rb':>5s} "
+              f"{'build_graph':>12s} {'build_rb':>10s} {'build_rb_data':>14s}")
+        for mol_file in mol_files:
+            atom_num, bond_num, rb_num, best = time_graph_model(
+                mol_file, args.repeat)
+            print(f"{os.path.basename(mol_file):<24s} {atom_num:6d} {bond_num:6d} {rb_num:5d} "
+                  f"{best['build_graph']:12.4f} {best['build_rb']:10.4f} {best['build_rb_data']:14.4f}")
+
+
+if __name__ == "__main__":
+    main()
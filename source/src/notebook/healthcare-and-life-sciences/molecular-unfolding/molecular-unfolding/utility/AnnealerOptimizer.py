@@ -11,6 +11,8 @@ from dwave.system.composites import EmbeddingComposite
 from braket.ocean_plugin import BraketDWaveSampler
 from braket.ocean_plugin import BraketSampler
 
+from .QUBOModel import QUBOModel
+
 import time
 import pickle  # nosec
 import os
@@ -76,14 +78,22 @@ class Annealer():
         if self.method == "dwave-sa" or self.method == "neal-sa":
             # response = self.sampler.sample(
             #     self.qubo, num_reads=self.param["shots"]).aggregate()
-            self.response = self.sampler.sample_qubo(
-                self.qubo, num_reads=self.param["shots"])
+            if isinstance(self.qubo, QUBOModel):
+                self.response = self.sampler.sample(
+                    self.qubo.to_bqm(), num_reads=self.param["shots"])
+            else:
+                self.response = self.sampler.sample_qubo(
+                    self.qubo, num_reads=self.param["shots"])
         elif self.method == "dwave-qa":
             # response = self.sampler.sample(
             #     self.qubo, num_reads=self.param["shots"]).aggregate()
             # actually it's quantum task
-            self.response = self.sampler.sample_qubo(
-                self.qubo, shots=self.param["shots"])
+            if isinstance(self.qubo, QUBOModel):
+                self.response = self.sampler.sample(
+                    self.qubo.to_bqm(), shots=self.param["shots"])
+            else:
+                self.response = self.sampler.sample_qubo(
+                    self.qubo, shots=self.param["shots"])
         end = time.time()
         self.time["run-time"] = end-start
         result = {}
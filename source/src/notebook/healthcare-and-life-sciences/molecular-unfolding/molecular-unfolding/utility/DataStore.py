@@ -0,0 +1,152 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+########################################################################################################################
+#   The following functions are the on-disk format for the data and the models
+########################################################################################################################
+import numpy as np
+from collections.abc import MutableMapping
+import json
+import shutil
+import os
+import logging
+
+log = logging.getLogger()
+log.setLevel('INFO')
+
+STORE_FORMAT = "qc-data-store"
+# increase the version for the changes that the old loaders can not read
+# 2: json documents besides the manifest
+STORE_VERSION = 2
+MANIFEST_NAME = "manifest.json"
+
+
+"""
+    A store is a directory with one .npy file for each array, one .json file for each document
+    and a manifest.json with the format version, the kind of the object, the json metadata and
+    the list of the arrays and the documents. The arrays are loaded memory-mapped and the
+    documents on request, so only the parts that are used are read.
+"""
+
+
+def save_store(save_path, kind, meta, arrays, documents=None):
+    # write to a temporary directory and swap it in, the arrays of a store that is
+    # still mapped by a loaded object are unlinked instead of overwritten
+    tmp_path = f"{save_path}.tmp-{os.getpid()}"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    manifest = {"format": STORE_FORMAT, "version": STORE_VERSION,
+                "kind": kind, "meta": meta, "arrays": {}, "documents": {}}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        file_name = f"{name}.npy"
+        np.save(os.path.join(tmp_path, file_name), array, allow_pickle=False)
+        manifest["arrays"][name] = {"file": file_name, "dtype": array.dtype.str,
+                                    "shape": list(array.shape)}
+    for name, document in (documents or {}).items():
+        file_name = f"{name}.json"
+        with open(os.path.join(tmp_path, file_name), "w") as f:
+            json.dump(document, f, default=_json_default)
+        manifest["documents"][name] = {"file": file_name}
+    with open(os.path.join(tmp_path, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, default=_json_default)
+
+    if os.path.exists(save_path):
+        old_path = f"{save_path}.old-{os.getpid()}"
+        os.rename(save_path, old_path)
+        os.rename(tmp_path, save_path)
+        shutil.rmtree(old_path)
+    else:
+        os.rename(tmp_path, save_path)
+    return save_path
+
+
+def is_store(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, MANIFEST_NAME))
+
+
+class DataStore():
+
+    def __init__(self, path, kind=None, mmap_mode="r"):
+        self.path = path
+        self.mmap_mode = mmap_mode
+
+        with open(os.path.join(path, MANIFEST_NAME), "r") as f:
+            manifest = json.load(f)
+        if manifest.get("format") != STORE_FORMAT:
+            raise Exception(f"{path} is not a data store !")
+        if manifest["version"] > STORE_VERSION:
+            raise Exception(
+                f"store version {manifest['version']} of {path} is newer than the supported version {STORE_VERSION} !")
+        if kind is not None and manifest["kind"] != kind:
+            raise Exception(
+                f"store {path} has kind {manifest['kind']}, expect {kind} !")
+
+        self.version = manifest["version"]
+        self.kind = manifest["kind"]
+        self.meta = manifest["meta"]
+        self.arrays = manifest["arrays"]
+        self.documents = manifest.get("documents", {})
+
+    def array(self, name):
+        return np.load(os.path.join(self.path, self.arrays[name]["file"]),
+                       mmap_mode=self.mmap_mode, allow_pickle=False)
+
+    def document(self, name):
+        with open(os.path.join(self.path, self.documents[name]["file"]), "r") as f:
+            return json.load(f)
+
+    def keys(self):
+        return self.arrays.keys()
+
+    def __contains__(self, name):
+        return name in self.arrays
+
+
+class LazyStoreDict(MutableMapping):
+    """
+        Dict of the items saved in a store, the keys are read from the index and
+        an item is loaded by load_item(store, index[key]) when it is first used.
+    """
+
+    def __init__(self, store, index, load_item):
+        self._store = store
+        self._index = dict(index)
+        self._load_item = load_item
+        self._items = {}
+
+    def __getitem__(self, key):
+        if key not in self._items:
+            self._items[key] = self._load_item(self._store, self._index[key])
+        return self._items[key]
+
+    def __setitem__(self, key, value):
+        self._items[key] = value
+        self._index.setdefault(key, None)
+
+    def __delitem__(self, key):
+        del self._index[key]
+        self._items.pop(key, None)
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def is_loaded(self, key):
+        return key in self._items
+
+
+def _json_default(value):
+    # numpy scalars and sets in the metadata
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"{type(value)} is not json serializable")
@@ -11,26 +11,135 @@ import logging
 log = logging.getLogger()
 log.setLevel('INFO')
 
+# the value of pi used by the torsion angles in degree
+pi = 3.1415926
+
+
+class AtomPosData():
+    """
+        Array-backed positions of the atoms in a molecule.
+        The coordinates are kept in a contiguous (N,3) float64 array, with index maps for
+        the atom ids, the van der waals radius and the axis of the last rotation of each atom.
+        atom_pos_data[atom_id] gives the dict of the previous versions, 'idx' is the pair of axis
+        points of the last rotation, ([0, 0, 0], [0, 0, 0]) if the atom was not rotated.
+        Every change of the coordinates bumps a version, so the centroids of the fragments are
+        cached until one of their atoms moves.
+        The rotated coordinates keep the full float64 precision, unless decimals is set to round
+        them after each rotation.
+    """
+
+    def __init__(self, atom_data, decimals=None):
+        # atom_id <-> row of the arrays, keep the order of the mol file
+        self.atom_id = list(atom_data.keys())
+        self.atom_idx = {pt: n for n, pt in enumerate(self.atom_id)}
+
+        self.pts_raw = np.array([[info['x'], info['y'], info['z']]
+                                 for info in atom_data.values()], dtype=np.float64)
+        self.vdw_radius = np.array([info['vdw-radius']
+                                    for info in atom_data.values()], dtype=np.float64)
+        self.pts = self.pts_raw.copy()
+        # the two axis points of the last rotation, zeros if not rotated
+        self.rot_axis = np.zeros((len(self.atom_id), 2, 3), dtype=np.float64)
+
+        self.decimals = decimals
+
+        self._idx_cache = {}
+        # version of the coordinates, and the version at which each row last moved
+        self.version = 0
+        self.row_version = np.zeros(len(self.atom_id), dtype=np.int64)
+        # fragment -> (version, centroid)
+        self._centroid_cache = {}
+
+    def _touch(self, pt_idx):
+        self.version = self.version + 1
+        self.row_version[pt_idx] = self.version
+
+    def reset(self):
+        np.copyto(self.pts, self.pts_raw)
+        self.rot_axis.fill(0)
+        self._touch(slice(None))
+
+    def restore(self, pt_idx, pts, rot_axis):
+        # put back the positions saved before a rotation
+        self.pts[pt_idx] = pts
+        self.rot_axis[pt_idx] = rot_axis
+        self._touch(pt_idx)
+
+    def get_idx(self, pt_set):
+        # cache the rows for the fragment sets, which are used repeatedly
+        key = frozenset(pt_set)
+        if key not in self._idx_cache:
+            self._idx_cache[key] = np.array(
+                [self.atom_idx[pt] for pt in key], dtype=np.int64)
+        return self._idx_cache[key]
+
+    def get_pts(self, pt):
+        return self.pts[self.atom_idx[pt]]
+
+    def centroid(self, pt_set):
+        # only average again when an atom of the fragment moved since the last time
+        key = frozenset(pt_set)
+        idx = self.get_idx(key)
+        cached = self._centroid_cache.get(key)
+        if cached is not None and self.row_version[idx].max() <= cached[0]:
+            return cached[1]
+        centroid = np.mean(self.pts[idx], axis=0)
+        self._centroid_cache[key] = (self.version, centroid)
+        return centroid
+
+    def rotate(self, pt_idx, start_idx, end_idx, theta, rot=None):
+        rot_axis = self.pts[[start_idx, end_idx]]
+        if rot is None:
+            self.pts[pt_idx] = batch_rotate_pts(
+                self.pts[start_idx], self.pts[end_idx], self.pts[pt_idx], theta, self.decimals)
+        else:
+            self.pts[pt_idx] = rotate_pts_by_matrix(
+                self.pts[start_idx], self.pts[pt_idx], rot, self.decimals)
+        self.rot_axis[pt_idx] = rot_axis
+        self._touch(pt_idx)
+
+    # dict-like views to keep compatible with atom_pos_data[atom_id]['pts']
+    def keys(self):
+        return self.atom_id
+
+    def items(self):
+        return ((pt, self[pt]) for pt in self.atom_id)
+
+    def __len__(self):
+        return len(self.atom_id)
 
-def sub_list(l1, l2):
-    result = []
-    for n in range(len(l1)):
-        result.append(l1[n]-l2[n])
-    return result
+    def __iter__(self):
+        return iter(self.atom_id)
 
+    def __contains__(self, pt):
+        return pt in self.atom_idx
 
-def add_list(l1, l2):
-    result = []
-    for n in range(len(l1)):
-        result.append(l1[n]+l2[n])
-    return result
+    def __getitem__(self, pt):
+        n = self.atom_idx[pt]
+        rot_axis = self.rot_axis[n].tolist()
+        return {'pts': self.pts[n].tolist(), 'idx': (rot_axis[0], rot_axis[1]), 'vdw-radius': self.vdw_radius[n]}
 
 
-def rount_list(l):
-    result = []
-    for n in l:
-        result.append(round(n, 4))
-    return result
+class RotationTable():
+    """
+        Rotation matrices of the D discrete angles for each rotatable bond.
+        The matrices only depend on the direction of the bond, so they are computed once
+        and rebuilt only when the axis has moved (e.g. an upstream torsion was applied).
+    """
+
+    def __init__(self, theta_option):
+        self.thetas = np.array(theta_option, dtype=np.float64)/180*pi
+        # rb_name -> (axis used for the matrices, (D,3,3) matrices)
+        self.table = {}
+
+    def get(self, rb_name, p1, p2):
+        axis = np.asarray(p2, dtype=np.float64) - \
+            np.asarray(p1, dtype=np.float64)
+        if rb_name in self.table and np.array_equal(self.table[rb_name][0], axis):
+            return self.table[rb_name][1]
+        rot = rotation_matrices(p1, p2, self.thetas)
+        self.table[rb_name] = (axis, rot)
+        return rot
 
 
 """
@@ -42,50 +151,69 @@ def rount_list(l):
 
 
 def PointRotate3D(p1, p2, p0, theta):
-    #     from point import Point
-    from math import cos, sin, sqrt
+    return batch_rotate_pts(p1, p2, [p0], theta)[0].tolist()
 
-    # Translate so axis is at origin
-    p = sub_list(p0, p1)
-    # Initialize point q
-    q = [0.0, 0.0, 0.0]
-    N = sub_list(p2, p1)
-#     Nm = sqrt(N.x**2 + N.y**2 + N.z**2)
-    Nm = sqrt(N[0]**2 + N[1]**2 + N[2]**2)
 
+"""
+    Return the rotation matrices (Rodrigues' formula) about the axis p1->p2.
+    Arguments: 'axis point 1', 'axis point 2', 'angles of rotation (in radians)' >> (K,3,3) matrices
+"""
+
+
+def rotation_matrices(p1, p2, thetas):
     # Rotation axis unit vector
-    n = [N[0]/Nm, N[1]/Nm, N[2]/Nm]
-
-    # Matrix common factors
-    c = cos(theta)
-    t = (1 - cos(theta))
-    s = sin(theta)
-    X = n[0]
-    Y = n[1]
-    Z = n[2]
-
-    # Matrix 'M'
-    d11 = t*X**2 + c
-    d12 = t*X*Y - s*Z
-    d13 = t*X*Z + s*Y
-    d21 = t*X*Y + s*Z
-    d22 = t*Y**2 + c
-    d23 = t*Y*Z - s*X
-    d31 = t*X*Z - s*Y
-    d32 = t*Y*Z + s*X
-    d33 = t*Z**2 + c
-
-    #            |p.x|
-    # Matrix 'M'*|p.y|
-    #            |p.z|
-    q[0] = d11*p[0] + d12*p[1] + d13*p[2]
-    q[1] = d21*p[0] + d22*p[1] + d23*p[2]
-    q[2] = d31*p[0] + d32*p[1] + d33*p[2]
-
-    # Translate axis and rotated point back to original location
-    sum_p = add_list(q, p1)
-    final_p = rount_list(sum_p)
-    return final_p
+    N = np.asarray(p2, dtype=np.float64) - np.asarray(p1, dtype=np.float64)
+    X, Y, Z = N / np.sqrt(np.sum(N**2))
+
+    # Matrix common factors, one slice per angle
+    thetas = np.atleast_1d(np.asarray(thetas, dtype=np.float64))
+    c = np.cos(thetas)[:, None, None]
+    t = 1 - c
+    s = np.sin(thetas)[:, None, None]
+
+    outer = np.array([[X*X, X*Y, X*Z],
+                      [X*Y, Y*Y, Y*Z],
+                      [X*Z, Y*Z, Z*Z]])
+    cross = np.array([[0.0, -Z, Y],
+                      [Z, 0.0, -X],
+                      [-Y, X, 0.0]])
+
+    return t*outer + c*np.eye(3) + s*cross
+
+
+"""
+    Return all the points rotated about the axis p1->p2 for every angle in one call.
+    Arguments: 'axis point 1', 'axis point 2', '(N,3) points to be rotated', 'angle or (K,) angles (in radians)',
+    'decimals to round to, None for the full precision'
+    >> (N,3) new points for a single angle, (K,N,3) new points for K angles
+"""
+
+
+def batch_rotate_pts(p1, p2, pts, thetas, decimals=None):
+    rotate_pts = rotate_pts_by_matrix(
+        p1, pts, rotation_matrices(p1, p2, thetas), decimals)
+
+    if np.ndim(thetas) == 0:
+        return rotate_pts[0]
+    return rotate_pts
+
+
+"""
+    Return the points rotated by the (3,3) or (K,3,3) rotation matrices about an axis through p1.
+    Arguments: 'axis point 1', '(N,3) points to be rotated', 'rotation matrices',
+    'decimals to round to, None for the full precision' >> (N,3) or (K,N,3) new points
+"""
+
+
+def rotate_pts_by_matrix(p1, pts, rot, decimals=None):
+    p1 = np.asarray(p1, dtype=np.float64)
+    pts = np.asarray(pts, dtype=np.float64).reshape(-1, 3)
+
+    # Translate so axis is at origin, rotate, then translate back
+    rotate_pts = np.matmul(pts - p1, np.swapaxes(rot, -1, -2)) + p1
+    if decimals is not None:
+        return np.round(rotate_pts, decimals)
+    return rotate_pts
 
 
 def get_idx(var, var_rb_map):
@@ -116,18 +244,20 @@ def get_current_pts(pts_name, pts_dict, mol_data):
 
 
 def update_pts(start_pts, end_pts, pts_list, rotate_theta):
-    rotate_list = []
     logging.debug("start_pts {}".format(start_pts))
     logging.debug("end_pts {}".format(end_pts))
     logging.debug("pts_list {}".format(pts_list))
-    pi = 3.1415926
-    for pt in pts_list:
-        if pt['idx'] != (start_pts[0]['pts'], end_pts[0]['pts']):
-            rotate_list.append(PointRotate3D(
-                start_pts[0]['pts'], end_pts[0]['pts'], pt['pts'], rotate_theta/180*pi))
-        else:
-            logging.debug("avoid same rotate *******")
-            rotate_list.append(pt['pts'])
+    rot_bd = (start_pts[0]['pts'], end_pts[0]['pts'])
+    rotate_list = [pt['pts'] for pt in pts_list]
+    # avoid rotating the points already rotated by the same bond
+    rotate_idx = [n for n, pt in enumerate(pts_list) if pt['idx'] != rot_bd]
+    if len(rotate_idx) != len(pts_list):
+        logging.debug("avoid same rotate *******")
+    if len(rotate_idx) != 0:
+        rotate_pts = batch_rotate_pts(rot_bd[0], rot_bd[1], [
+                                      rotate_list[n] for n in rotate_idx], rotate_theta/180*pi)
+        for n, pt in zip(rotate_idx, rotate_pts.tolist()):
+            rotate_list[n] = pt
     return rotate_list
 
 
@@ -154,6 +284,65 @@ def calc_distance_between_pts(pts1, pts2):
     return np.linalg.norm(pts1_middle-pts2_middle)
 
 
+"""
+    Return the pairs of atoms closer than their van der waals radii, by a cell list: the atoms are
+    put in cubic cells as large as the largest threshold, so only the atoms of the same or of the
+    13 neighbour cells of the half shell are compared.
+    Arguments: '(N,3) points', '(N,) radii', 'sorted keys i*N+j (i<j) of the pairs not checked',
+    'threshold of a pair: max or sum of the radii', 'only the first pair'
+    >> (K,2) rows (i<j) of the pairs in order
+"""
+
+
+def find_clashes(pts, radius, exclusion=None, combine="max", first=False):
+    pts = np.asarray(pts, dtype=np.float64)
+    radius = np.asarray(radius, dtype=np.float64)
+    n = len(pts)
+    no_clash = np.zeros((0, 2), dtype=np.int64)
+    if n < 2:
+        return no_clash
+    cutoff = radius.max() if combine == "max" else 2 * radius.max()
+    if cutoff <= 0:
+        return no_clash
+
+    cell = np.floor((pts - pts.min(axis=0)) / cutoff).astype(np.int64)
+    dims = cell.max(axis=0) + 1
+    key = (cell[:, 0] * dims[1] + cell[:, 1]) * dims[2] + cell[:, 2]
+    order = np.argsort(key, kind="stable")
+    sorted_key = key[order]
+
+    pair_i = []
+    pair_j = []
+    offsets = [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+               for dz in (-1, 0, 1) if (dx, dy, dz) >= (0, 0, 0)]
+    for offset in offsets:
+        neighbor = cell + np.array(offset, dtype=np.int64)
+        valid = np.all((neighbor >= 0) & (neighbor < dims), axis=1)
+        neighbor_key = (neighbor[:, 0] * dims[1] +
+                        neighbor[:, 1]) * dims[2] + neighbor[:, 2]
+        start = np.searchsorted(sorted_key, neighbor_key, side="left")
+        count = np.where(valid, np.searchsorted(
+            sorted_key, neighbor_key, side="right") - start, 0)
+        i = np.repeat(np.arange(n), count)
+        j = order[np.repeat(start - np.cumsum(count) + count, count) +
+                  np.arange(count.sum())]
+        if offset == (0, 0, 0):
+            i, j = i[i < j], j[i < j]
+        pair_i.append(np.minimum(i, j))
+        pair_j.append(np.maximum(i, j))
+    i = np.concatenate(pair_i)
+    j = np.concatenate(pair_j)
+
+    threshold = np.maximum(radius[i], radius[j]) if combine == "max" else radius[i] + radius[j]
+    clash = np.sqrt(np.sum((pts[i] - pts[j])**2, axis=1)) < threshold
+    pair_key = np.sort(i[clash] * n + j[clash])
+    if exclusion is not None and len(exclusion) != 0:
+        pair_key = pair_key[~np.isin(pair_key, exclusion)]
+    if first:
+        pair_key = pair_key[:1]
+    return np.stack([pair_key // n, pair_key % n], axis=1)
+
+
 def calc_mid_pts(pts, mol_data):
     pts_pos = []
     for pt in pts:
@@ -180,12 +369,27 @@ def pts_pos_list(pts_dict_list):
     return pts_list
 
 
-def update_pts_distance(atom_pos_data, rb_set, tor_map, var_rb_map, theta_option, update_local_pts=False, update_distance=False):
-    def _gen_pts_pos_list(pt_set, atom_pos_data):
-        return [atom_pos_data[pt]['pts'] for pt in pt_set]
+def update_pts_distance(atom_pos_data, rb_set, tor_map, var_rb_map, theta_option, update_local_pts=False, update_distance=False, rot_table=None, geometry="atom"):
+    # geometry: "atom" measures the rotated atoms, "centroid" rotates the fragment centroids and the
+    # axis atoms only, the atoms are still rotated if update_local_pts
+    if update_distance and geometry == "centroid":
+        tor_list = []
+        for var_name, affect_tor_pts_set in (tor_map or {}).items():
+            rb_name = var_rb_map[var_name.split('_')[1]]
+            tor_list.append((rb_name, int(var_name.split('_')[2])-1,
+                             set.union(rb_set['f_1_set'], affect_tor_pts_set)))
+        frame = centroid_frame(atom_pos_data, rb_set, [
+                               (rb_name, whole_set) for rb_name, _, whole_set in tor_list])
+        frame_pts, weight, moved, frag, axis_row = frame
+        for k, (rb_name, d, _) in enumerate(tor_list):
+            p1, p2 = frame_pts[axis_row[k]].copy()
+            if rot_table is not None:
+                rot = rot_table.get(rb_name, p1, p2)[d]
+            else:
+                rot = rotation_matrices(p1, p2, theta_option[d]/180*pi)[0]
+            frame_pts[moved[:, k]] = rotate_frame(
+                p1, frame_pts[moved[:, k]], weight[moved[:, k]], rot)
 
-    def _gen_pts_list(pt_set, atom_pos_data):
-        return [atom_pos_data[pt] for pt in pt_set]
     # rb_set
     if update_local_pts:
 
@@ -193,24 +397,193 @@ def update_pts_distance(atom_pos_data, rb_set, tor_map, var_rb_map, theta_option
             d = var_name.split('_')[2]
             rb_name = var_rb_map[var_name.split('_')[1]]
             # update points
-            start_pts = atom_pos_data[rb_name.split('+')[0]]
-            end_pts = atom_pos_data[rb_name.split('+')[1]]
-            whole_set = set.union(rb_set['f_1_set'], affect_tor_pts_set)
-            gen_pts = _gen_pts_list(whole_set, atom_pos_data)
+            start_idx, end_idx = [atom_pos_data.atom_idx[pt]
+                                  for pt in rb_name.split('+')]
+            whole_idx = atom_pos_data.get_idx(
+                set.union(rb_set['f_1_set'], affect_tor_pts_set))
             theta = theta_option[int(d)-1]
-            rotate_list = update_pts([start_pts], [end_pts], gen_pts, theta)
-            for pt_name, pt_value in zip(whole_set, rotate_list):
-                atom_pos_data[pt_name]['pts'] = pt_value
+            rot = None
+            if rot_table is not None:
+                rot = rot_table.get(rb_name, atom_pos_data.pts[start_idx], atom_pos_data.pts[end_idx])[
+                    int(d)-1]
+            atom_pos_data.rotate(whole_idx, start_idx,
+                                 end_idx, theta/180*pi, rot)
 
     distance = None
-    if update_distance:
+    if update_distance and geometry == "centroid":
+        distance = frame_distance(frame_pts, weight, frag)
+    elif update_distance:
         # calculate distance
-        distance = calc_distance_between_pts(_gen_pts_pos_list(
-            rb_set['f_0_set'], atom_pos_data), _gen_pts_pos_list(rb_set['f_1_set'], atom_pos_data))
+        distance = np.linalg.norm(atom_pos_data.centroid(
+            rb_set['f_0_set']) - atom_pos_data.centroid(rb_set['f_1_set']))
 
     return distance
 
 
+"""
+    Return the points the distance of rb_set depends on under a chain of torsions: each axis atom
+    alone, and the sums of the atoms of f_0_set and f_1_set grouped by the torsions moving them.
+    A rigid rotation commutes with the average, so rotating a sum of w atoms about p1 as
+    R(sum - w*p1) + w*p1 gives the rotated sum, whatever the size of the fragments.
+    Arguments: 'AtomPosData', '[(rotatable bond, atoms moved by its torsion)] in order'
+    >> (P,3) points, (P,) weights, (P,K) moved by each torsion, (P,) 0/1 for f_0_set/f_1_set and -1
+    for the axis atoms, (K,2) points of the axis of each torsion
+"""
+
+
+def centroid_frame(atom_pos_data, rb_set, tor_list):
+    pts = atom_pos_data.pts
+    whole_list = [atom_pos_data.get_idx(whole_set)
+                  for _, whole_set in tor_list]
+
+    axis_idx = np.array([[atom_pos_data.atom_idx[pt] for pt in rb_name.split('+')]
+                         for rb_name, _ in tor_list], dtype=np.int64).reshape(-1, 2)
+    axis_unique, axis_row = np.unique(axis_idx, return_inverse=True)
+    frame_pts = [pts[axis_unique]]
+    weight = [np.ones(len(axis_unique))]
+    moved = [np.stack([np.isin(axis_unique, whole_idx) for whole_idx in whole_list], axis=1).reshape(
+        len(axis_unique), len(whole_list))]
+    frag = [np.full(len(axis_unique), -1, dtype=np.int64)]
+
+    for n, frag_set in enumerate((rb_set['f_0_set'], rb_set['f_1_set'])):
+        frag_idx = atom_pos_data.get_idx(frag_set)
+        frag_moved = np.stack([np.isin(frag_idx, whole_idx) for whole_idx in whole_list], axis=1).reshape(
+            len(frag_idx), len(whole_list))
+        # the atoms moved by the same torsions stay rigid together
+        group_moved, group = np.unique(
+            frag_moved, axis=0, return_inverse=True)
+        group = group.reshape(-1)
+        group_pts = np.zeros((len(group_moved), 3))
+        np.add.at(group_pts, group, pts[frag_idx])
+        frame_pts.append(group_pts)
+        weight.append(np.bincount(
+            group, minlength=len(group_moved)).astype(np.float64))
+        moved.append(group_moved)
+        frag.append(np.full(len(group_moved), n, dtype=np.int64))
+
+    return (np.concatenate(frame_pts), np.concatenate(weight), np.concatenate(moved),
+            np.concatenate(frag), axis_row.reshape(-1, 2))
+
+
+def rotate_frame(p1, frame_pts, weight, rot):
+    # weighted sums about p1 by the (3,3) or (K,3,3) matrices
+    p1 = np.asarray(p1, dtype=np.float64)
+    shift = weight[:, None] * p1
+    return np.matmul(frame_pts - shift, np.swapaxes(rot, -1, -2)) + shift
+
+
+def frame_distance(frame_pts, weight, frag):
+    # distance between the centroids of f_0_set and f_1_set, for (P,3) or (K,P,3) points
+    centroids = [np.sum(frame_pts[..., frag == n, :], axis=-2) /
+                 weight[frag == n].sum() for n in (0, 1)]
+    return np.linalg.norm(centroids[0] - centroids[1], axis=-1)
+
+
+"""
+    Apply the torsions of rb_list depth-first for all the combinations of the D angles, and yield
+    (angle index of each torsion, distance between f_0_set and f_1_set) in lexicographic order.
+    The partially rotated positions of a prefix are shared by all its combinations, so every
+    torsion of the tree is applied once instead of once per combination. At the leaves only the
+    atoms of f_0_set and f_1_set moved by the last torsion are rotated, and a fragment untouched
+    by it takes its cached centroid.
+    With geometry "centroid" only the points of centroid_frame are rotated, so the cost of a term
+    does not depend on the size of the fragments, and the distances agree with "atom" up to the
+    floating point error (or the rounding if AtomPosData.decimals is set).
+    Arguments: 'AtomPosData', 'rb_set', 'rotatable bonds', 'atoms affected by each torsion besides f_1_set', 'RotationTable',
+    'atom or centroid'
+"""
+
+
+def update_pts_distance_tree(atom_pos_data, rb_set, rb_list, affect_set_list, rot_table, geometry="atom"):
+    if geometry == "centroid":
+        yield from _update_centroid_tree(atom_pos_data, rb_set, rb_list, affect_set_list, rot_table)
+        return
+
+    pts = atom_pos_data.pts
+    D = len(rot_table.thetas)
+
+    tor_idx_list = []
+    for rb_name, affect_tor_pts_set in zip(rb_list, affect_set_list):
+        start_idx, end_idx = [atom_pos_data.atom_idx[pt]
+                              for pt in rb_name.split('+')]
+        whole_idx = atom_pos_data.get_idx(
+            set.union(rb_set['f_1_set'], affect_tor_pts_set))
+        tor_idx_list.append((rb_name, start_idx, end_idx, whole_idx))
+
+    # the rows of each fragment moved or not by the last torsion
+    last_idx = tor_idx_list[-1][3]
+    frag_list = []
+    for frag_set in (rb_set['f_0_set'], rb_set['f_1_set']):
+        frag_idx = atom_pos_data.get_idx(frag_set)
+        moved = np.isin(frag_idx, last_idx)
+        frag_list.append((frag_set, len(frag_idx), frag_idx[~moved], frag_idx[moved]))
+    rotate_idx = np.concatenate([frag[3] for frag in frag_list])
+
+    def _update_tree(depth, angle_list):
+        rb_name, start_idx, end_idx, whole_idx = tor_idx_list[depth]
+        rot = rot_table.get(rb_name, pts[start_idx], pts[end_idx])
+
+        if depth == len(tor_idx_list) - 1:
+            # last torsion: rotate for all the angles at once
+            rotate_pts = rotate_pts_by_matrix(
+                pts[start_idx], pts[rotate_idx], rot, atom_pos_data.decimals)
+            centroids = []
+            start = 0
+            for frag_set, frag_len, static_idx, moved_idx in frag_list:
+                if len(moved_idx) == 0:
+                    centroids.append(atom_pos_data.centroid(frag_set))
+                    continue
+                moved_sum = np.sum(
+                    rotate_pts[:, start:start+len(moved_idx)], axis=1)
+                start = start + len(moved_idx)
+                centroids.append(
+                    (moved_sum + np.sum(pts[static_idx], axis=0)) / frag_len)
+            distances = np.broadcast_to(np.linalg.norm(
+                centroids[0] - centroids[1], axis=-1), (D,))
+            for d in range(D):
+                yield tuple(angle_list + [d]), distances[d]
+            return
+
+        # keep the positions of the prefix to restore after each angle
+        saved_pts = pts[whole_idx]
+        saved_rot_axis = atom_pos_data.rot_axis[whole_idx]
+        for d in range(D):
+            atom_pos_data.rotate(whole_idx, start_idx,
+                                 end_idx, None, rot[d])
+            yield from _update_tree(depth + 1, angle_list + [d])
+            atom_pos_data.restore(whole_idx, saved_pts, saved_rot_axis)
+
+    yield from _update_tree(0, [])
+
+
+def _update_centroid_tree(atom_pos_data, rb_set, rb_list, affect_set_list, rot_table):
+    D = len(rot_table.thetas)
+    frame_pts, weight, moved, frag, axis_row = centroid_frame(atom_pos_data, rb_set, [
+        (rb_name, set.union(rb_set['f_1_set'], affect_tor_pts_set)) for rb_name, affect_tor_pts_set in zip(rb_list, affect_set_list)])
+
+    def _update_tree(depth, angle_list):
+        p1, p2 = frame_pts[axis_row[depth]].copy()
+        rot = rot_table.get(rb_list[depth], p1, p2)
+        row = moved[:, depth]
+
+        if depth == len(rb_list) - 1:
+            # last torsion: rotate for all the angles at once
+            leaf_pts = np.repeat(frame_pts[np.newaxis], D, axis=0)
+            leaf_pts[:, row] = rotate_frame(p1, frame_pts[row], weight[row], rot)
+            distances = frame_distance(leaf_pts, weight, frag)
+            for d in range(D):
+                yield tuple(angle_list + [d]), distances[d]
+            return
+
+        saved_pts = frame_pts[row]
+        for d in range(D):
+            frame_pts[row] = rotate_frame(p1, saved_pts, weight[row], rot[d])
+            yield from _update_tree(depth + 1, angle_list + [d])
+            frame_pts[row] = saved_pts
+
+    yield from _update_tree(0, [])
+
+
 def atom_distance_func(rotate_values, mol_data, var_rb_map, theta_option, M):
     # save temp results for pts
     temp_pts_dict = {}
@@ -321,39 +694,78 @@ def get_same_direction_set(candidate_set, rb_data, rb_name):
     return direction_set
 
 
-def mol_distance_func(atom_pos_data, check, set):
+"""
+    Return the distances of all the pairs of points in the condensed order (i<j, row by row), computed
+    by blocks of rows to bound the memory, and the pairs closer than the sum of their radii.
+    Arguments: '(N,3) points', '(N,) radii, no check if None', 'float64 or float32 for big molecules',
+    'max number of pairs in a block'
+    >> (N*(N-1)/2,) distances, (K,2) rows (i<j) of the pairs in order
+"""
+
+
+def pair_distances(pts, radius=None, dtype=np.float64, max_entries=2**20):
+    pts = np.asarray(pts, dtype=dtype).reshape(-1, 3)
+    n = len(pts)
+    distance = np.empty(n*(n-1)//2, dtype=dtype)
+    clash = []
+    if radius is not None:
+        radius = np.asarray(radius, dtype=dtype)
+
+    step = max(1, max_entries // max(n, 1))
+    pos = 0
+    for start in range(0, n-1, step):
+        end = min(start + step, n-1)
+        # rows start..end-1 against the columns after start, only j > i is kept
+        diff = pts[start:end, None, :] - pts[None, start+1:, :]
+        block = np.sqrt(np.einsum('ijk,ijk->ij', diff, diff))
+        upper = np.arange(start+1, n)[None, :] > np.arange(start, end)[:, None]
+        values = block[upper]
+        distance[pos:pos+len(values)] = values
+        pos = pos + len(values)
+        if radius is not None:
+            row, col = np.nonzero(upper & (
+                block < radius[start:end, None] + radius[None, start+1:]))
+            clash.append(np.stack([row + start, col + start + 1], axis=1))
+
+    if radius is None or len(clash) == 0:
+        return distance, np.zeros((0, 2), dtype=np.int64)
+    return distance, np.concatenate(clash).astype(np.int64)
+
+
+def mol_distance_func(atom_pos_data, check, set, exclusion_key=None, dtype=np.float64):
     max_idx = max([int(num) for num in atom_pos_data.keys()])
+    atom_key = [str(idx) for idx in range(1, max_idx+1)]
 
-    sum_distance = 0
+    if isinstance(atom_pos_data, AtomPosData):
+        row = [atom_pos_data.atom_idx[pt] for pt in atom_key]
+        pts = atom_pos_data.pts[row]
+        radius = atom_pos_data.vdw_radius[row]
+    else:
+        pts = [atom_pos_data[pt]['pts'] for pt in atom_key]
+        radius = [atom_pos_data[pt]['vdw-radius'] for pt in atom_key]
 
-    record_distance = []
+    distance, clash = pair_distances(pts, radius, dtype)
+    sum_distance = distance.sum(dtype=np.float64)
 
     map_set = set
 
-    for left_idx in range(max_idx-1):
-        for right_idx in range(left_idx+1, max_idx):
-            left_key = str(left_idx+1)
-            right_key = str(right_idx+1)
-
-            distance = calc_distance_between_pts([atom_pos_data[left_key]['pts']], [
-                                                 atom_pos_data[right_key]['pts']])
-
-            if check == 'initial':
-                check_radius_distance = atom_pos_data[left_key]['vdw-radius'] + \
-                    atom_pos_data[right_key]['vdw-radius']
-                if check_radius_distance > distance:
-                    map_set.add((left_key, right_key))
-                    logging.debug(
-                        f"!!!!!!!!!!!! initial van der waals check fail at {left_key} and {right_key} with check: {check_radius_distance} v.s. real {distance}")
-            if check == 'test':
-                check_radius_distance = atom_pos_data[left_key]['vdw-radius'] + \
-                    atom_pos_data[right_key]['vdw-radius']
-                if check_radius_distance > distance and (left_key, right_key) not in map_set:
-                    logging.debug(
-                        f"!!!!!!!!!!!! found van der waals check fail at {left_key} and {right_key} with check: {check_radius_distance} v.s. real {distance}")
-
-            sum_distance = sum_distance + distance
-
-            record_distance.append(distance)
-
-    return sum_distance, record_distance, map_set
+    # the exclusion_key of BuildMolGraph, these pairs are not checked
+    if exclusion_key is not None and len(clash) != 0:
+        clash = clash[~np.isin(clash[:, 0] * len(atom_key) + clash[:, 1], exclusion_key)]
+
+    for left_idx, right_idx in clash.tolist():
+        left_key = atom_key[left_idx]
+        right_key = atom_key[right_idx]
+        # the position in the condensed distances
+        check_distance = distance[left_idx*len(atom_key) -
+                                  left_idx*(left_idx+1)//2 + right_idx - left_idx - 1]
+        check_radius_distance = radius[left_idx] + radius[right_idx]
+        if check == 'initial':
+            map_set.add((left_key, right_key))
+            logging.debug(
+                f"!!!!!!!!!!!! initial van der waals check fail at {left_key} and {right_key} with check: {check_radius_distance} v.s. real {check_distance}")
+        if check == 'test' and (left_key, right_key) not in map_set:
+            logging.debug(
+                f"!!!!!!!!!!!! found van der waals check fail at {left_key} and {right_key} with check: {check_radius_distance} v.s. real {check_distance}")
+
+    return sum_distance, distance, map_set
@@ -12,8 +12,9 @@ import os
 import datetime
 import logging
 import re
+import numpy as np
 
-from .MolGeoCalc import update_pts_distance, get_same_direction_set, calc_distance_between_pts
+from .MolGeoCalc import AtomPosData, RotationTable, update_pts_distance, get_same_direction_set, find_clashes
 from .MoleculeParser import MoleculeData
 
 import py3Dmol
@@ -42,17 +43,15 @@ class ResultParser():
         # result: get by task_id, maintain by braket api
         self.result = None
         # initial mol file
-        self.atom_pos_data = {}
-        self.atom_pos_data_raw = {}
-        self.atom_pos_data_temp = {}
         self.mol_file_name = param["raw_path"]
         logging.info("MoleculeData.load()")
         self.data_path = param["data_path"]
         self.mol_data = MoleculeData.load(param["data_path"])
         logging.info("init mol data for final position")
-        self._init_mol_file(self.atom_pos_data)
+        self.atom_pos_data = AtomPosData(self.mol_data.atom_data)
         logging.info("init mol data for raw position")
-        self._init_mol_file(self.atom_pos_data_raw)
+        self.atom_pos_data_raw = AtomPosData(self.mol_data.atom_data)
+        self.atom_pos_data_temp = AtomPosData(self.mol_data.atom_data)
         # parse model_info
         self.rb_var_map = None
         self.var_rb_map = None
@@ -69,7 +68,7 @@ class ResultParser():
         # parameters
         self.physical_check = True
         if self.physical_check == True:
-            self.non_contact_atom_map = self._init_non_contact_atom()
+            self.exclusion_key = self._init_exclusion()
 
         # keep N recent results
         self.N = 100
@@ -83,19 +82,10 @@ class ResultParser():
                 self.bucket, self.prefix, self.task_id, "results.json")
             self.result = json.loads(obj["Body"].read())
 
-    def _init_non_contact_atom(self):
-        mol_graph = self.mol_data.bond_graph.mol_ug
-
-        non_contact_atom_map = {}
-
-        for node_main in mol_graph.nodes:
-            non_contact_atom = []
-            for node_candidate in mol_graph.nodes:
-                if node_candidate != node_main and node_candidate not in mol_graph.neighbors(node_main):
-                    non_contact_atom.append(node_candidate)
-            non_contact_atom_map[node_main] = non_contact_atom
-
-        return non_contact_atom_map
+    def _init_exclusion(self):
+        # the bonded and the angle atom pairs are not checked, the keys of BuildMolGraph are
+        # over the rows of atom_pos_data
+        return self.mol_data.bond_graph.exclusion_key
 
     def _init_parameters(self):
         logging.info("_init_parameters")
@@ -104,20 +94,11 @@ class ResultParser():
         self.parameters["volume"]["initial"] = 0
 
     def _init_mol_file(self, pos_data):
-        for pt, info in self.mol_data.atom_data.items():
-            pos_data[pt] = {}
-            pos_data[pt]['pts'] = [info['x'], info['y'], info['z']]
-            pos_data[pt]['idx'] = ([0, 0, 0], [0, 0, 0])
-            pos_data[pt]['vdw-radius'] = info['vdw-radius']
+        pos_data.reset()
 
     def _init_temp_mol_file(self):
         logging.info("_init_mol_file")
-        for pt, info in self.mol_data.atom_data.items():
-            self.atom_pos_data_temp[pt] = {}
-            self.atom_pos_data_temp[pt]['pts'] = [
-                info['x'], info['y'], info['z']]
-            self.atom_pos_data_temp[pt]['idx'] = ([0, 0, 0], [0, 0, 0])
-            self.atom_pos_data_temp[pt]['vdw-radius'] = info['vdw-radius']
+        self.atom_pos_data_temp.reset()
 
     def _read_result_obj(self, bucket, prefix, task_id, file_name):
         logging.info("_read_result_obj")
@@ -187,6 +168,7 @@ class ResultParser():
         self.M = int(model_name.split("_")[0])
         self.D = int(model_name.split("_")[1])
         self.theta_option = [x * 360/self.D for x in range(self.D)]
+        self.rot_table = RotationTable(self.theta_option)
 
         for rb in self.raw_result["model_info"]["rb_name"]:
             var = self.rb_var_map[rb]
@@ -200,11 +182,8 @@ class ResultParser():
     def generate_optimize_pts(self):
         logging.info("generate_optimize_pts()")
         # get best configuration
-        pddf_sample_result = self.raw_result["response"].aggregate(
-        ).to_pandas_dataframe()
-
-        pddf_head_sample = pddf_sample_result.sort_values(
-            by=['energy']).head(self.N)
+        head_chosen_var = self._head_chosen_var(
+            self.raw_result["response"].aggregate(), self.N)
 
         evaluate_loop_result = False
         max_optimize_gain = 1.0
@@ -214,8 +193,8 @@ class ResultParser():
         max_ris = None
         max_volume = 0
 
-        for index, row in pddf_head_sample.iterrows():
-            generate_row = self._generate_row_data(row)
+        for index, head_var in head_chosen_var:
+            generate_row = self._generate_row_data(head_var)
 
             max_optimize_gain = 1.0
             evaluate_loop_result = False
@@ -303,9 +282,25 @@ class ResultParser():
                 rb_set['f_1_set'], self.mol_data.bond_graph.rb_data, base_rb_name)
 
             update_pts_distance(self.atom_pos_data, rb_set, tor_map,
-                                self.var_rb_map, self.theta_option, True, False)
+                                self.var_rb_map, self.theta_option, True, False, self.rot_table)
+
+    def _head_chosen_var(self, sample_result, N):
+        # (index, chosen angle variables) of the N samples with the lowest energy, read from
+        # the sample matrix of the SampleSet in the order of the energy
+        var_idx = {var: n for n, var in enumerate(sample_result.variables)}
+        valid_var_angle = [
+            var for var in self.valid_var_angle if var in var_idx]
+        angle_idx = np.array([var_idx[var]
+                             for var in valid_var_angle], dtype=np.int64)
+
+        record = sample_result.record
+        head_idx = np.argsort(record.energy, kind='quicksort')[:N]
+        head_chosen = record.sample[head_idx][:, angle_idx] == 1
 
-    def _generate_row_data(self, candidate_result):
+        valid_var_angle = np.array(valid_var_angle, dtype=object)
+        return [(index, set(valid_var_angle[chosen].tolist())) for index, chosen in zip(head_idx.tolist(), head_chosen)]
+
+    def _generate_row_data(self, chosen_var):
         M = self.M
         D = self.D
 
@@ -314,10 +309,6 @@ class ResultParser():
         logging.debug("generate_optimize_pts model_info={}".format(
             self.raw_result["model_info"]))
 
-        best_config = candidate_result.filter(items=self.valid_var_angle)
-
-        chosen_var = set(best_config[best_config == 1].index.tolist())
-
         # change chose var to dict
         var_dict_list = []
         var_dict_raw = {}
@@ -446,7 +437,7 @@ class ResultParser():
             self._init_mol_file(self.atom_pos_data_temp)
 
             optimize_distance = update_pts_distance(
-                self.atom_pos_data_temp, rb_set, tor_map, self.var_rb_map, self.theta_option, True, True)
+                self.atom_pos_data_temp, rb_set, tor_map, self.var_rb_map, self.theta_option, True, True, self.rot_table)
             optimize_volume = optimize_volume + optimize_distance
 
             if self.parameters["volume"]["initial"] == 0:
@@ -467,26 +458,17 @@ class ResultParser():
         return optimize_gain, optimize_volume
 
     def _physical_check_van_der_waals(self, atom_raw):
-        check_result = True
-        for atom_index, atom_info in atom_raw.items():
-            vdw_radius = atom_info['vdw-radius']
-            atom_pos = atom_info['pts']
-            if check_result == False:
-                break
-            for non_contact_atom in self.non_contact_atom_map[atom_index]:
-                non_contact_atom_pos = atom_raw[non_contact_atom]['pts']
-                distance = calc_distance_between_pts(
-                    [atom_pos], [non_contact_atom_pos])
-#                 if non_contact_atom == '14' and atom_index == '1':
-#                       logging.info(f"fail at {atom_index} to {non_contact_atom} for distance {distance}")
-                if distance < vdw_radius:
-                    logging.info(f"fail at {atom_index} to {non_contact_atom}")
-                    check_result = False
-                    break
-
-        return check_result
-
-    def save_mol_file(self, save_name):
+        # an atom is too close to another atom within the larger of their radii
+        clash = find_clashes(atom_raw.pts, atom_raw.vdw_radius,
+                             self.exclusion_key, "max", True)
+        if len(clash) != 0:
+            logging.info(
+                f"fail at {atom_raw.atom_id[clash[0][0]]} to {atom_raw.atom_id[clash[0][1]]}")
+            return False
+        return True
+
+    def save_mol_file(self, save_name, decimals=4):
+        # decimals: the coordinates are only rounded when written, None for the full precision
         logging.info(f"save_mol_file {save_name}")
         raw_f = open(self.mol_file_name, "r")
         lines = raw_f.readlines()
@@ -501,9 +483,10 @@ class ResultParser():
             regrex = re.compile(
                 r"[-+]?\d+\.\d+ +[-+]?\d+\.\d+ +[-+]?\d+\.\d+", re.IGNORECASE)
 
-            update_pos_x = atom_pos_data[atom_idx]['pts'][0]
-            update_pos_y = atom_pos_data[atom_idx]['pts'][1]
-            update_pos_z = atom_pos_data[atom_idx]['pts'][2]
+            update_pos = atom_pos_data.get_pts(atom_idx)
+            if decimals is not None:
+                update_pos = np.round(update_pos, decimals)
+            update_pos_x, update_pos_y, update_pos_z = update_pos.tolist()
 
             update_pos = "{}    {}    {}".format(
                 update_pos_x, update_pos_y, update_pos_z)
@@ -0,0 +1,8 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import os
+import sys
+
+# the notebooks import the package as utility from the molecular-unfolding directory
+sys.path.insert(0, os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,110 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import math
+import os
+
+import networkx as nx
+import numpy as np
+
+from utility.GraphModel import BuildMolGraph
+from utility.MolGeoCalc import AtomPosData, find_clashes, mol_distance_func
+from utility.MoleculeParser import MoleculeData
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "molecular-unfolding-data")
+
+
+def _bond_arrays(bonds):
+    return {"bond_id": np.array([str(n+1) for n in range(len(bonds))]),
+            "atom1": np.array([str(atom_1) for atom_1, _ in bonds]),
+            "atom2": np.array([str(atom_2) for _, atom_2 in bonds]),
+            "bond_type": np.array(["1"] * len(bonds))}
+
+
+def _nx_rb_order(bond_arrays):
+    # the rotatable bonds of the networkx betweenness: both atoms on a shortest path, the graph
+    # without the bond has no path between them, ordered by the average score with the ties in bond table order
+    graph = nx.Graph()
+    graph.add_edges_from(zip(bond_arrays["atom1"].tolist(), bond_arrays["atom2"].tolist()))
+    bc = nx.betweenness_centrality(graph)
+    score = {}
+    for rb, bond_type in zip(zip(bond_arrays["atom1"].tolist(), bond_arrays["atom2"].tolist()),
+                             bond_arrays["bond_type"].tolist()):
+        if bond_type == "ar" or math.isclose(bc[rb[0]], 0) or math.isclose(bc[rb[1]], 0):
+            continue
+        graph.remove_edge(*rb)
+        if not nx.has_path(graph, *rb):
+            score.setdefault("{}+{}".format(*rb), round((bc[rb[0]] + bc[rb[1]])/2, 12))
+        graph.add_edge(*rb)
+    return sorted(score.items(), key=lambda rb: -rb[1])
+
+
+def _rb_order(bond_graph):
+    return [(rb, data["bc_num"]) for rb, data in bond_graph.rb_data_list[-1].items()]
+
+
+def test_rb_order_matches_networkx():
+    mol_data = MoleculeData(os.path.join(
+        DATA_PATH, "117_ideal.mol2"), "qmu")
+    assert _rb_order(mol_data.bond_graph) == _nx_rb_order(mol_data.bond_arrays)
+
+
+def test_rb_order_keeps_bond_table_order_of_ties():
+    # four equal arms 1-2-3-4, 1-5-6-7, 1-8-9-10 and 1-11-12-13 around the atom 1
+    bonds = []
+    for arm in [(2, 3, 4), (5, 6, 7), (8, 9, 10), (11, 12, 13)]:
+        bonds.extend([(1, arm[0]), (arm[0], arm[1]), (arm[1], arm[2])])
+    bond_arrays = _bond_arrays(bonds)
+    bond_graph = BuildMolGraph(bond_arrays, 13)
+
+    rb_order = _rb_order(bond_graph)
+    assert rb_order == _nx_rb_order(bond_arrays)
+    assert [rb for rb, _ in rb_order] == ["1+2", "1+5", "1+8", "1+11",
+                                         "2+3", "5+6", "8+9", "11+12"]
+
+
+def test_ring_bond_invalid_in_disconnected_graph():
+    # a ring 1-6 with the chain 7-9, and the chain 10-13 in another component
+    ring = [(1, 2), (2, 3), (3, 4), (4, 5), (5, 6), (6, 1)]
+    bonds = ring + [(1, 7), (7, 8), (8, 9), (10, 11), (11, 12), (12, 13)]
+    bond_graph = BuildMolGraph(_bond_arrays(bonds), 13)
+
+    # the ring bonds are named but not rotatable, although the graph without one of them
+    # still has two components
+    assert bond_graph.rb_name == ["1+2", "2+3", "3+4", "4+5", "5+6", "6+1", "1+7", "7+8", "11+12"]
+    assert bond_graph.rb_list == [("1", "7"), ("7", "8"), ("11", "12")]
+    assert set(bond_graph.rb_data.keys()) == {"1+7", "7+8", "11+12"}
+
+    # the fragments of a bridge are the components of the graph without it
+    rb_data = bond_graph.rb_data["1+7"]
+    assert rb_data["f_0_set"] == {"2", "3", "4", "5", "6"}
+    assert rb_data["f_1_set"] == {"8", "9"}
+    assert rb_data["f_2_set"] == {"10", "11", "12", "13"}
+    rb_data = bond_graph.rb_data["11+12"]
+    assert rb_data["f_0_set"] == {str(atom) for atom in range(1, 10)}
+    assert rb_data["f_1_set"] == {"10"}
+    assert rb_data["f_2_set"] == {"13"}
+
+
+def test_exclusion_key_shared_by_distance_and_clash_check():
+    mol_data = MoleculeData(os.path.join(
+        DATA_PATH, "117_ideal.mol2"), "qmu")
+    bond_graph = mol_data.bond_graph
+    atom_pos_data = AtomPosData(mol_data.atom_data)
+    n = len(atom_pos_data.atom_id)
+    assert bond_graph.atom_num == n
+
+    # one key per exclusion pair over the rows of atom_pos_data
+    pairs = bond_graph.exclusion['1-2'] + bond_graph.exclusion['1-3']
+    rows = sorted(tuple(sorted(atom_pos_data.atom_idx[pt] for pt in pair)) for pair in pairs)
+    assert bond_graph.exclusion_key.tolist() == [i * n + j for i, j in rows]
+
+    # the bonded pairs are within the radii, they are only reported without the exclusion
+    _, _, all_clash = mol_distance_func(atom_pos_data, 'initial', set())
+    _, _, clash = mol_distance_func(
+        atom_pos_data, 'initial', set(), bond_graph.exclusion_key)
+    excluded = {frozenset(pair) for pair in pairs}
+    assert any(frozenset(pair) in excluded for pair in all_clash)
+    assert clash == {pair for pair in all_clash if frozenset(pair) not in excluded}
+    assert len(find_clashes(atom_pos_data.pts, atom_pos_data.vdw_radius,
+                            bond_graph.exclusion_key, "max", True)) == 0
@@ -0,0 +1,236 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import os
+import shutil
+
+import pytest
+
+from utility.DataStore import DataStore
+from utility.MoleculeParser import MoleculeData, MoleculeLibrary, MOLECULE_READERS, VAN_DER_WAALS_DICT
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "molecular-unfolding-data")
+
+
+def test_library_loads_one_entry_at_a_time(tmp_path, monkeypatch):
+    mol_dir = tmp_path / "mols"
+    mol_dir.mkdir()
+    for name in ["a", "b", "c"]:
+        shutil.copy(os.path.join(DATA_PATH, "117_ideal.mol2"),
+                    str(mol_dir / f"{name}.mol2"))
+
+    # the files are read only when their molecules are reached
+    opened = []
+    read_mol2 = MOLECULE_READERS["mol2"]
+
+    def counted_read_mol2(mol_file):
+        opened.append(os.path.basename(mol_file))
+        return read_mol2(mol_file)
+
+    monkeypatch.setitem(MOLECULE_READERS, "mol2", counted_read_mol2)
+    library = MoleculeLibrary(str(mol_dir), "qmu")
+    molecules = iter(library)
+    assert next(molecules).name == "a"
+    assert opened == ["a.mol2"]
+    save_path = library.save("test", str(tmp_path))
+    assert opened == ["a.mol2", "a.mol2", "b.mol2", "c.mol2"]
+
+    # only the bond graph of the requested molecule is decoded
+    documents = []
+    document = DataStore.document
+
+    def counted_document(self, name):
+        documents.append(name)
+        return document(self, name)
+
+    monkeypatch.setattr(DataStore, "document", counted_document)
+    loaded = MoleculeLibrary.load(save_path)
+    mol_data = loaded[1]
+    assert documents == ["bond_graph_1"]
+    assert mol_data.name == "b"
+    assert mol_data.bond_graph.rb_name == \
+        MoleculeData(os.path.join(DATA_PATH, "117_ideal.mol2"), "qmu").bond_graph.rb_name
+
+
+def _pdb_atom(serial, atom_name, x, element):
+    # fixed columns of an ATOM record, element '' leaves the element columns blank
+    return f"ATOM  {serial:5d} {atom_name:<4s} LIG A   1    {x:8.3f}{0.0:8.3f}{0.0:8.3f}" \
+        f"  1.00  0.00          {element:>2s}\n"
+
+
+def _write_pdb(path, models, conect):
+    # models: [[(atom_name, element)]] with the atoms along x, the CONECT records after the last model
+    lines = ["COMPND    LIG\n"]
+    for n, atoms in enumerate(models, 1):
+        lines.append(f"MODEL     {n:4d}\n")
+        lines.extend(_pdb_atom(serial, atom_name, 1.5 * serial, element)
+                     for serial, (atom_name, element) in enumerate(atoms, 1))
+        lines.append("ENDMDL\n")
+    lines.extend(
+        "CONECT" + "".join(f"{serial:5d}" for serial in row) + "\n" for row in conect)
+    lines.append("END\n")
+    path.write_text("".join(lines))
+    return str(path)
+
+
+def test_read_pdb_conect_after_models(tmp_path):
+    atoms = [(" C1 ", "C"), (" C2 ", "C"), (" O3 ", "O")]
+    conect = [(1, 2), (2, 1, 3), (3, 2)]
+
+    # CONECT after the ENDMDL of the last model
+    records = list(MOLECULE_READERS["pdb"](
+        _write_pdb(tmp_path / "models.pdb", [atoms, atoms], conect)))
+    assert len(records) == 2
+    for record in records:
+        bond_arrays = record["bond_arrays"]
+        assert list(zip(bond_arrays["atom1"], bond_arrays["atom2"])) == [
+            ("1", "2"), ("2", "3")]
+
+    # a single model in MODEL/ENDMDL
+    records = list(MOLECULE_READERS["pdb"](
+        _write_pdb(tmp_path / "model.pdb", [atoms], conect)))
+    assert len(records) == 1
+    assert len(records[0]["bond_arrays"]["bond_id"]) == 2
+
+
+def test_read_pdb_blank_element(tmp_path):
+    # the element is read from the atom name, C-alpha " CA " is carbon and "CA  " calcium
+    atoms = [(" CA ", ""), ("CA  ", ""), ("HG11", ""), ("1HB ", ""), (" N  ", "")]
+    records = list(MOLECULE_READERS["pdb"](
+        _write_pdb(tmp_path / "blank.pdb", [atoms], [])))
+    assert records[0]["atom_arrays"]["atom_type"].tolist() == [
+        "C", "Ca", "H", "H", "N"]
+
+
+def _write_sdf(path, molecules):
+    # molecules: [(name, [(element, charge code)], [(atom1, atom2, bond type)], [(atom, charge)] of M  CHG)]
+    lines = []
+    for name, atoms, bonds, charges in molecules:
+        lines.extend([name, "  test", ""])
+        lines.append(f"{len(atoms):3d}{len(bonds):3d}  0  0  0  0  0  0  0  0999 V2000")
+        lines.extend(f"{1.5 * n:10.4f}{0.0:10.4f}{0.0:10.4f} {element:<3s} 0{code:3d}  0  0  0  0  0  0  0  0  0  0"
+                     for n, (element, code) in enumerate(atoms))
+        lines.extend(f"{atom_1:3d}{atom_2:3d}{bond_type:3d}  0" for atom_1, atom_2, bond_type in bonds)
+        if len(charges) != 0:
+            lines.append(f"M  CHG{len(charges):3d}" + "".join(f"{atom:4d}{charge:4d}" for atom, charge in charges))
+        lines.extend(["M  END", "$$$$"])
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def test_read_sdf(tmp_path):
+    chain = [(1, 2, 1), (2, 3, 2), (3, 4, 1)]
+    ring = [(1, 2, 4), (2, 3, 4), (3, 4, 4), (4, 5, 4), (5, 6, 4), (6, 1, 4), (1, 7, 1)]
+    sdf_file = _write_sdf(tmp_path / "two.sdf", [
+        ("chain", [("C", 0), ("C", 3), ("N", 0), ("O", 0)], chain, []),
+        ("ring", [("C", 0)] * 6 + [("O", 5)], ring, [(7, -1), (2, 1)])])
+    records = list(MOLECULE_READERS["sdf"](sdf_file))
+    assert [record["name"] for record in records] == ["chain", "ring"]
+
+    atom_arrays = records[0]["atom_arrays"]
+    assert atom_arrays["atom_id"].tolist() == ["1", "2", "3", "4"]
+    assert atom_arrays["atom_name"].tolist() == ["C1", "C2", "N1", "O1"]
+    assert atom_arrays["x"].tolist() == [0.0, 1.5, 3.0, 4.5]
+    # charge code 3 of the atom block is +1
+    assert atom_arrays["charge"].tolist() == [0.0, 1.0, 0.0, 0.0]
+    bond_arrays = records[0]["bond_arrays"]
+    assert list(zip(bond_arrays["atom1"], bond_arrays["atom2"], bond_arrays["bond_type"])) == [
+        ("1", "2", "1"), ("2", "3", "2"), ("3", "4", "1")]
+
+    # the aromatic bonds are 'ar', the M  CHG charges replace the atom block charges
+    assert records[1]["bond_arrays"]["bond_type"].tolist() == ["ar"] * 6 + ["1"]
+    assert records[1]["atom_arrays"]["charge"].tolist() == [0.0, 1.0, 0.0, 0.0, 0.0, 0.0, -1.0]
+
+
+def test_molecule_data_with_metals(tmp_path):
+    # a calcium and a sodium in a pdb ligand
+    pdb_file = _write_pdb(tmp_path / "metal.pdb", [[(" C1 ", "C"), ("CA  ", "CA"), ("NA  ", "NA")]],
+                          [(1, 2), (2, 1, 3), (3, 2)])
+    mol_data = MoleculeData(pdb_file, "qmu")
+    assert mol_data.atom_arrays["atom_type"].tolist() == ["C", "Ca", "Na"]
+    assert mol_data.atom_arrays["vdw-radius"].tolist() == [
+        VAN_DER_WAALS_DICT[element] for element in ["C", "Ca", "Na"]]
+
+    elements = ["C", "Zn", "C", "Mg", "C", "B", "C", "Si", "C", "Se", "C", "Fe", "C"]
+    sdf_file = _write_sdf(tmp_path / "metal.sdf", [
+        ("metal", [(element, 0) for element in elements],
+         [(n, n + 1, 1) for n in range(1, len(elements))], [])])
+    mol_data = MoleculeData(sdf_file, "qmu")
+    assert mol_data.atom_arrays["vdw-radius"].tolist() == [
+        VAN_DER_WAALS_DICT[element] for element in elements]
+    assert len(mol_data.bond_graph.rb_list) == len(elements) - 3
+
+
+def test_molecule_data_unknown_element(tmp_path):
+    sdf_file = _write_sdf(tmp_path / "gd.sdf", [
+        ("gd", [("C", 0), ("Gd", 0), ("C", 0)], [(1, 2, 1), (2, 3, 1)], [])])
+    with pytest.raises(Exception, match="no van der waals radius of the elements Gd in gd"):
+        MoleculeData(sdf_file, "qmu")
+
+
+def _write_multi_mol2(path):
+    # 117_ideal, then a molecule with only the required atom columns and a comment
+    with open(os.path.join(DATA_PATH, "117_ideal.mol2")) as f:
+        text = f.read()
+    small = "\n".join(["@<TRIPOS>MOLECULE", "small", "4 3 0 0 0", "SMALL", "NO_CHARGES", "",
+                       "# required columns only", "@<TRIPOS>ATOM",
+                       "1 C1 0.0 0.0 0.0 C.3", "2 C2 1.5 0.0 0.0 C.3",
+                       "3 C3 3.0 0.0 0.0 C.3", "4 O1 4.5 0.0 0.0 O.3",
+                       "@<TRIPOS>BOND", "1 1 2 1", "2 2 3 1", "3 3 4 1", ""])
+    path.write_text(text + "\n" + small)
+    return str(path)
+
+
+def test_read_multi_molecule_mol2(tmp_path):
+    mol_file = _write_multi_mol2(tmp_path / "multi.mol2")
+    records = list(MOLECULE_READERS["mol2"](mol_file))
+    assert [record["name"] for record in records] == ["117", "small"]
+    assert len(records[0]["atom_arrays"]["atom_id"]) == 76
+    assert len(records[0]["bond_arrays"]["bond_id"]) == 79
+
+    # the optional columns get the defaults of the mol2 format
+    atom_arrays = records[1]["atom_arrays"]
+    assert atom_arrays["x"].tolist() == [0.0, 1.5, 3.0, 4.5]
+    assert atom_arrays["subst_id"].tolist() == [1] * 4
+    assert atom_arrays["subst_name"].tolist() == ["****"] * 4
+    assert atom_arrays["charge"].tolist() == [0.0] * 4
+
+    # the views of a molecule after the first one
+    mol_data = MoleculeData(mol_file, "qmu", index=1)
+    assert mol_data.name == "multi_1"
+    assert mol_data.atom_data["4"]["atom_type"] == "O.3"
+    assert mol_data.bond["atom2"].tolist() == ["2", "3", "4"]
+    assert mol_data.bond_graph.rb_list == [("2", "3")]
+
+
+def test_read_mol2_matches_biopandas():
+    pandas_mol2 = pytest.importorskip("biopandas.mol2")
+    mol_file = os.path.join(DATA_PATH, "117_ideal.mol2")
+    atom_arrays = next(MOLECULE_READERS["mol2"](mol_file))["atom_arrays"]
+    df_atoms = pandas_mol2.PandasMol2().read_mol2(mol_file).df
+    for column in df_atoms.columns:
+        assert atom_arrays[column].tolist() == df_atoms[column].astype(
+            atom_arrays[column].dtype).tolist()
+
+
+def test_library_with_workers(tmp_path):
+    # a multi-molecule file in chunks of one molecule, and a directory of files
+    mol_file = _write_multi_mol2(tmp_path / "multi.mol2")
+    mol_dir = tmp_path / "mols"
+    mol_dir.mkdir()
+    shutil.copy(mol_file, str(mol_dir / "a.mol2"))
+    shutil.copy(os.path.join(DATA_PATH, "117_ideal.mol2"), str(mol_dir / "b.mol2"))
+
+    for path, names in [(mol_file, ["multi", "multi_1"]), (str(mol_dir), ["a", "a_1", "b"])]:
+        serial = list(MoleculeLibrary(path, "qmu"))
+        library = MoleculeLibrary(path, "qmu", workers=2, chunk_size=1)
+        parallel = list(library)
+        assert [mol_data.name for mol_data in parallel] == names
+        assert [mol_data.bond_graph.rb_name for mol_data in parallel] == \
+            [mol_data.bond_graph.rb_name for mol_data in serial]
+        assert [mol_data.atom_arrays["x"].tolist() for mol_data in parallel] == \
+            [mol_data.atom_arrays["x"].tolist() for mol_data in serial]
+
+        loaded = MoleculeLibrary.load(library.save("test", str(tmp_path)))
+        assert len(loaded) == len(names)
+        assert [mol_data.name for mol_data in loaded] == names
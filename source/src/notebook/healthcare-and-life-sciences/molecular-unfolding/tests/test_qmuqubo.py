@@ -0,0 +1,97 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import itertools
+import os
+
+import numpy as np
+
+from utility.MoleculeParser import MoleculeData
+from utility.QMUQUBO import QMUQUBO, reduce_hubo
+import utility.QMUQUBO as qmu_qubo_module
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "molecular-unfolding-data")
+
+
+def _hubo_energy(hubo, sample):
+    return sum(bias * np.prod([sample[var] for var in term]) for term, bias in hubo.items())
+
+
+def _qubo_energy(qubo, sample):
+    return sum(bias * sample[u] * sample[v] for (u, v), bias in qubo.items())
+
+
+def test_reduce_hubo_ground_energy():
+    # terms of one x_{m}_{d} per rotatable bond like the distance terms: the pairs of M=1 are
+    # (x, x), and the higher order terms share the bonds of their ris groups
+    rng = np.random.default_rng(0)
+    rb_var = {rb: [f"x_{rb}_{d}" for d in (1, 2)] for rb in "1234"}
+    hubo = {}
+    for ris in [("1",), ("2", "3"), ("1", "2", "3"), ("2", "3", "4"), ("1", "2", "3", "4")]:
+        for term in itertools.product(*[rb_var[rb] for rb in ris]):
+            term = term + term if len(term) == 1 else term
+            hubo[term] = rng.uniform(-3, 1)
+
+    qubo_objective, qubo_constraint = reduce_hubo(hubo)
+    strength = 1 + sum(abs(bias) for bias in hubo.values())
+    qubo = dict(qubo_objective)
+    for key, bias in qubo_constraint.items():
+        qubo[key] = qubo.get(key, 0) + strength * bias
+
+    variables = [var for rb in sorted(rb_var) for var in rb_var[rb]]
+    aux = sorted({var for key in qubo for var in key} - set(variables))
+    assert len(aux) > 0
+    for values in itertools.product((0, 1), repeat=len(variables)):
+        sample = dict(zip(variables, values))
+        ground = min(_qubo_energy(qubo, dict(sample, **dict(zip(aux, aux_values))))
+                     for aux_values in itertools.product((0, 1), repeat=len(aux)))
+        assert np.isclose(ground, _hubo_energy(hubo, sample))
+
+
+def _qmu_qubo(mol_data, **param):
+    qmu_qubo = QMUQUBO(mol_data, ["pre-calc"], **{"pre-calc": {"param": ["M", "D", "A", "hubo_qubo_val"]}})
+    qmu_qubo.build_model(**{"pre-calc": param})
+    return qmu_qubo
+
+
+def test_save_load_reuses_hubo_distances(tmp_path, monkeypatch):
+    mol_data = MoleculeData(os.path.join(DATA_PATH, "117_ideal.mol2"), "qmu")
+    qmu_qubo = _qmu_qubo(mol_data, M=[1, 2], D=[4], A=[300], hubo_qubo_val=[200])
+    save_path = qmu_qubo.save("test", str(tmp_path))
+
+    loaded = QMUQUBO.load(save_path)
+    assert sorted(loaded.hubo_distances) == ["1_4", "2_4"]
+    for cell_name, cell in qmu_qubo.hubo_distances.items():
+        assert list(loaded.hubo_distances[cell_name]["hubo"].items()) == list(cell["hubo"].items())
+        assert loaded.hubo_distances[cell_name]["qubo"] == cell["qubo"]
+
+    # the models for a new A are built from the saved cells
+    def _fail(*args, **kwargs):
+        raise AssertionError("distance terms recomputed")
+    monkeypatch.setattr(qmu_qubo_module, "_build_hubo_distances", _fail)
+    param = {"M": [1, 2], "D": [4], "A": [100], "hubo_qubo_val": [200]}
+    loaded.build_model(**{"pre-calc": param})
+    monkeypatch.undo()
+    qmu_qubo.build_model(**{"pre-calc": param})
+    for model_name in ["1_4_100_200", "2_4_100_200"]:
+        assert loaded.get_model("pre-calc", model_name)["qubo"].to_qubo() == \
+            qmu_qubo.get_model("pre-calc", model_name)["qubo"].to_qubo()
+
+
+def test_geometry_modes_build_the_same_hubo():
+    # the fragment centroids of the centroid mode are those of the rotated atoms
+    mol_data = MoleculeData(os.path.join(DATA_PATH, "117_ideal.mol2"), "qmu")
+    param = {"M": [2, 3], "D": [4], "A": [300], "hubo_qubo_val": [200]}
+    hubo = {}
+    for geometry in ["atom", "centroid"]:
+        qmu_qubo = QMUQUBO(mol_data, ["pre-calc"], **{"pre-calc": {"param": list(param)}})
+        qmu_qubo.build_model(geometry=geometry, **{"pre-calc": param})
+        assert all(cell["geometry"] == geometry for cell in qmu_qubo.hubo_distances.values())
+        hubo[geometry] = {cell_name: cell["hubo"] for cell_name, cell in qmu_qubo.hubo_distances.items()}
+
+    assert sorted(hubo["atom"]) == ["2_4", "3_4"]
+    for cell_name, cell_hubo in hubo["atom"].items():
+        centroid_hubo = hubo["centroid"][cell_name]
+        assert list(centroid_hubo) == list(cell_hubo)
+        assert np.allclose([centroid_hubo[term] for term in cell_hubo],
+                           list(cell_hubo.values()), rtol=0, atol=1e-9)
@@ -6,7 +6,9 @@
 ########################################################################################################################
 
 import networkx as nx
-import math
+import numpy as np
+from collections.abc import Mapping
+import itertools
 
 import logging
 
@@ -26,54 +28,140 @@ class BuildMolGraph():
         self.build_graph()
 
         self.mol_ug = self.mol_g.to_undirected()
+        # the bonded (1-2) and the angle (1-3) atom pairs, the torsions do not change their distances
+        self.exclusion = self.build_exclusion()
+        self.exclusion_key = self.build_exclusion_key()
 
         # use betweenness_centrality to generate rotatabole bonds: self.mol_ug -> rb_list
         self.rb_list = self.build_rb()
         self.rb_data, self.rb_data_list = self.build_rb_data()
-        # test only N rb for graph model
-        self.sort_ris_data = {}
-        for M_cnt, rb_data in enumerate(self.rb_data_list):
-            self.sort_ris_data[str(M_cnt+1)] = self.build_ris_data(rb_data)
+        # test only N rb for graph model, the ris data of M is built when it is first used
+        self.sort_ris_data = SortRisData(self.rb_data_list, self.atom_num)
+
+    def to_dict(self):
+        # json data of the graph model, the bond table is saved with the molecule
+        def ris_to_dict(ris_data):
+            return {name: {'metrics': data['metrics'], 'f_0_set': list(data['f_0_set']),
+                           'f_1_set': list(data['f_1_set']), 'avg_bc_num': data['avg_bc_num'],
+                           'rb_count_num': data['rb_count_num']} for name, data in ris_data.items()}
+
+        graph_dict = {}
+        graph_dict['atom_num'] = self.atom_num
+        graph_dict['nodes'] = list(self.mol_g.nodes)
+        graph_dict['edges'] = list(self.mol_g.edges)
+        graph_dict['non_ar_bonds'] = self.non_ar_bonds
+        graph_dict['exclusion'] = self.exclusion
+        graph_dict['bc'] = self.bc
+        graph_dict['rb_list'] = self.rb_list
+        graph_dict['rb_num'] = self.rb_num
+        graph_dict['rb_name'] = self.rb_name
+        graph_dict['rb_data'] = {name: {'f_0_set': list(data['f_0_set']), 'f_1_set': list(data['f_1_set']),
+                                        'bc_num': data['bc_num']} for name, data in self.rb_data.items()}
+        # rb_data_list[M-1] holds the first M rotatable bonds of this order
+        graph_dict['rb_data_order'] = list(
+            self.rb_data_list[-1].keys()) if len(self.rb_data_list) != 0 else []
+        # only the ris data already built
+        graph_dict['sort_ris_data'] = {M: ris_to_dict(
+            self.sort_ris_data[M]) for M in self.sort_ris_data if not isinstance(
+            self.sort_ris_data, SortRisData) or self.sort_ris_data.is_loaded(M)}
+        return graph_dict
+
+    @classmethod
+    def from_dict(cls, graph_dict, df_bonds):
+        def ris_from_dict(ris_data):
+            return {name: {'metrics': data['metrics'], 'f_0_set': set(data['f_0_set']),
+                           'f_1_set': set(data['f_1_set']), 'avg_bc_num': data['avg_bc_num'],
+                           'rb_count_num': data['rb_count_num']} for name, data in ris_data.items()}
+
+        bond_graph = cls.__new__(cls)
+        bond_graph.df_bonds = df_bonds
+        bond_graph.atom_num = graph_dict['atom_num']
+
+        bond_graph.mol_g = nx.Graph()
+        bond_graph.mol_g.add_nodes_from(graph_dict['nodes'])
+        bond_graph.mol_g.add_edges_from(
+            tuple(edge) for edge in graph_dict['edges'])
+        bond_graph.mol_ug = bond_graph.mol_g.to_undirected()
+        # not saved by the older versions
+        bond_graph.exclusion = {level: [tuple(pair) for pair in pairs] for level, pairs in graph_dict['exclusion'].items(
+        )} if 'exclusion' in graph_dict else bond_graph.build_exclusion()
+        bond_graph.exclusion_key = bond_graph.build_exclusion_key()
+
+        bond_graph.non_ar_bonds = [tuple(rb)
+                                   for rb in graph_dict['non_ar_bonds']]
+        bond_graph.bc = graph_dict['bc']
+        bond_graph.rb_list = [tuple(rb) for rb in graph_dict['rb_list']]
+        bond_graph.rb_num = graph_dict['rb_num']
+        bond_graph.rb_name = graph_dict['rb_name']
+        bond_graph.rb_data = {name: {'f_0_set': set(data['f_0_set']), 'f_1_set': set(data['f_1_set']),
+                                     'bc_num': data['bc_num']} for name, data in graph_dict['rb_data'].items()}
+        bond_graph.rb_data_list = []
+        for M in range(len(graph_dict['rb_data_order'])):
+            bond_graph.rb_data_list.append(
+                {rb: bond_graph.rb_data[rb] for rb in graph_dict['rb_data_order'][:M+1]})
+        bond_graph.sort_ris_data = SortRisData(bond_graph.rb_data_list, bond_graph.atom_num, {M: ris_from_dict(
+            ris_data) for M, ris_data in graph_dict['sort_ris_data'].items()})
+        return bond_graph
 
     def build_graph(self):
-        def add_node(nodes_list, node):
-            if node not in nodes_list:
-                nodes_list.append(node)
-
-        def add_edge(edges_list, edge, rotatable_list, filter_by_type, bond_type):
-            if filter_by_type:
-                if bond_type != 'ar':
-                    rotatable_list.append(edge)
-            if edge not in edges_list:
-                edges_list.append(edge)
-
-        nodes_list = []
-        edges_list = []
+        # nodes and edges in the order of the bond table, without duplicates
+        atom1 = self.df_bonds['atom1'].tolist()
+        atom2 = self.df_bonds['atom2'].tolist()
+        edges_list = list(zip(atom1, atom2))
+        nodes_list = list(dict.fromkeys(
+            itertools.chain.from_iterable(edges_list)))
         # l_frag
         # r_frag
         # side_atom
         # bc_score
-        self.non_ar_bonds = []
-
-        for index, row in self.df_bonds.iterrows():
-            logging.debug("atom 1 {} atom 2 {}".format(
-                row['atom1'], row['atom2']))
-            add_node(nodes_list, row['atom1'])
-            add_node(nodes_list, row['atom2'])
-            add_edge(edges_list, (row['atom1'], row['atom2']),
-                     self.non_ar_bonds, True, row['bond_type'])
+        non_ar = np.asarray(self.df_bonds['bond_type'], dtype=str) != 'ar'
+        self.non_ar_bonds = [edge for edge, is_non_ar in zip(
+            edges_list, non_ar.tolist()) if is_non_ar]
 
         self.mol_g.add_nodes_from(nodes_list)
-        self.mol_g.add_edges_from(edges_list)
+        self.mol_g.add_edges_from(dict.fromkeys(edges_list))
+
+    def build_exclusion(self):
+        exclusion = {'1-2': [], '1-3': []}
+        bonded = set()
+        for u, v in self.mol_ug.edges:
+            exclusion['1-2'].append((u, v))
+            bonded.add(frozenset((u, v)))
+        angle = set()
+        for node in self.mol_ug.nodes:
+            for u, v in itertools.combinations(self.mol_ug.neighbors(node), 2):
+                pair = frozenset((u, v))
+                if pair not in bonded and pair not in angle:
+                    angle.add(pair)
+                    exclusion['1-3'].append((u, v))
+        return exclusion
+
+    def build_exclusion_key(self):
+        # sorted keys (id_1-1)*atom_num+(id_2-1) (id_1 < id_2) of all the exclusion pairs, the atom ids
+        # 1..atom_num are the rows of AtomPosData and of mol_distance_func
+        pairs = np.array(self.exclusion['1-2'] + self.exclusion['1-3'],
+                         dtype=str).reshape(-1, 2).astype(np.int64) - 1
+        return np.unique(pairs.min(axis=1) * int(self.atom_num) + pairs.max(axis=1))
 
     def build_rb(self):
-        self.bc = nx.betweenness_centrality(self.mol_ug)
+        # an atom has a betweenness centrality of 0 iff all its neighbours are bonded to each other,
+        # the non-aromatic bonds between two atoms on the shortest paths are rotatable
+        def on_path(node):
+            neighbors = list(self.mol_ug.neighbors(node))
+            return any(not self.mol_ug.has_edge(node_1, node_2) for node_1, node_2 in itertools.combinations(neighbors, 2))
+
+        node_on_path = {}
         rb_list = []
         for rot in self.non_ar_bonds:
-            if math.isclose(self.bc[rot[0]], 0) or math.isclose(self.bc[rot[1]], 0):
+            for node in rot:
+                if node not in node_on_path:
+                    node_on_path[node] = on_path(node)
+            if not node_on_path[rot[0]] or not node_on_path[rot[1]]:
                 continue
             rb_list.append(rot)
         self.rb_num = len(rb_list)
+        # betweenness centrality only orders the rotatable bonds
+        self.bc = nx.betweenness_centrality(self.mol_ug)
         return rb_list
 
     def build_rb_data(self):
@@ -94,38 +182,40 @@ class BuildMolGraph():
                     if pair_pts not in rb_data['pair_set']:
                         rb_data['pair_set'].add(pair_pts)
 
+        # only the bridges split the molecule, the bonds in rings are invalid even if the
+        # bond table has several components
+        fragments = bridge_fragments(self.mol_ug, self.rb_list)
+
         # add list to save invalid rb
         invalid_rb_list = []
         invalid_rb_name_list = []
         for rb in self.rb_list:
-            self.mol_ug.remove_edge(rb[0], rb[1])
             current_rb_name = "{}+{}".format(rb[0], rb[1])
             self.rb_name.append(current_rb_name)
         #     print(rb_name)
+            if frozenset(rb) not in fragments:
+                if current_rb_name not in invalid_rb_name_list:
+                    invalid_rb_list.append(rb)
+                    invalid_rb_name_list.append(current_rb_name)
+                continue
             if current_rb_name not in rb_data.keys():
                 rb_data[current_rb_name] = {}
-                i = 0
-                for pts in nx.connected_components(self.mol_ug):
-                    #             print(pts)
+                for i, pts in enumerate(fragments[frozenset(rb)]):
                     update_pts = pts.copy()
                     clear_set(update_pts, rb)
                     rb_data[current_rb_name]['f_{}_set'.format(i)] = update_pts
-                    i = i + 1
-                if "f_1_set" not in rb_data[current_rb_name].keys():
-                    invalid_rb_list.append(rb)
-                    invalid_rb_name_list.append(current_rb_name)
-                    # print(f"rb_name {current_rb_name} f_0_set {rb_data[current_rb_name]['f_0_set']} with length {len(rb_data[current_rb_name]['f_0_set'])}")
-                # update bc score
-                rb_data[current_rb_name]['bc_num'] = (
-                    self.bc[rb[0]] + self.bc[rb[1]])/2
+                # update bc score, rounded so that the floating point noise of the
+                # betweenness does not order the equal scores
+                rb_data[current_rb_name]['bc_num'] = round(
+                    (self.bc[rb[0]] + self.bc[rb[1]])/2, 12)
                 # update make pts pair set
         #         update_pts_pair(rb_data[rb_name])
-            self.mol_ug.add_edge(rb[0], rb[1])
 
         for invalid_rb, invalid_rb_name in zip(invalid_rb_list, invalid_rb_name_list):
             self.rb_list.remove(invalid_rb)
-            del rb_data[invalid_rb_name]
+            rb_data.pop(invalid_rb_name, None)
 
+        # the sort is stable, equal scores keep the order of the bond table
         sort_rb_data = {k: v for k, v in sorted(
             rb_data.items(), key=lambda rb: -rb[1]['bc_num'])}
 
@@ -141,57 +231,194 @@ class BuildMolGraph():
 
         return rb_data, rb_data_list
 
-    def build_ris_data(self, rb_data):
-        ris_data = {}
 
-        def judge_side_by_metrics(rb_data, candidate_pt):
-            if candidate_pt in rb_data['f_0_set']:
-                return 0
-            if candidate_pt in rb_data['f_1_set']:
-                return 1
-
-        def update_bc_info(ris_data_bond, rb_data, bond_group):
-            bc_num = []
-            for rb in bond_group:
-                bc_num.append(rb_data[rb]['bc_num'])
-            ris_data_bond['avg_bc_num'] = sum(bc_num)/len(bc_num)
-            ris_data_bond['rb_count_num'] = len(bc_num)
-
-        def update_ris_data(ris_data, rb_data, candidate_pair):
-            atom_l = candidate_pair[0]
-            atom_r = candidate_pair[1]
-            bond_group = []
-            for rb, pts_data in rb_data.items():
-                if (atom_l in pts_data['f_0_set'] and atom_r in pts_data['f_1_set']) or (atom_l in pts_data['f_1_set'] and atom_r in pts_data['f_0_set']):
-                    bond_group.append(rb)
+class SortRisData(Mapping):
+    """
+        sort_ris_data of BuildMolGraph, {str(M): ris data of the first M rotatable bonds}.
+        The ris data of M is built when it is first used, from the groups of the atom pairs
+        of M-1 split by the M-th rotatable bond, instead of from all the bonds again.
+    """
+
+    def __init__(self, rb_data_list, atom_num, items=None):
+        self._rb_data_list = rb_data_list
+        self._atom_num = atom_num
+        self._items = dict(items or {})
+        self._state = None
+
+    def __getitem__(self, key):
+        if key not in self._items:
+            if key not in self:
+                raise KeyError(key)
+            self._items[key] = self._build(int(key))
+        return self._items[key]
+
+    def __iter__(self):
+        return (str(M+1) for M in range(len(self._rb_data_list)))
+
+    def __len__(self):
+        return len(self._rb_data_list)
+
+    def __contains__(self, key):
+        return key in self._items or (isinstance(key, str) and key.isdigit() and str(int(key)) == key
+                                      and 1 <= int(key) <= len(self._rb_data_list))
+
+    def is_loaded(self, key):
+        return key in self._items
+
+    def __getstate__(self):
+        # the pair groups are rebuilt on request
+        state = self.__dict__.copy()
+        state["_state"] = None
+        return state
+
+    def _start(self):
+        atoms = [str(atom) for atom in range(1, self._atom_num+1)]
+        # the atom pairs (atom_l, atom_r), atom_l < atom_r, in the order of the ris names
+        idx_l, idx_r = np.triu_indices(len(atoms), 1)
+        # group 0 of the pairs not separated yet
+        self._state = {"M": 0, "atoms": atoms, "atom_idx": {atom: n for n, atom in enumerate(atoms)},
+                       "idx_l": idx_l, "idx_r": idx_r, "group": np.zeros(len(idx_l), dtype=np.int64),
+                       "group_bonds": [[]], "side": {}}
+
+    def _advance(self):
+        state = self._state
+        rb_data = self._rb_data_list[state["M"]]
+        rb = list(rb_data.keys())[-1]
+
+        # the side of the atoms for the new rotatable bond
+        side = np.zeros(len(state["atoms"]), dtype=bool)
+        present = np.zeros(len(state["atoms"]), dtype=bool)
+        for f, f_set in enumerate([rb_data[rb]['f_0_set'], rb_data[rb]['f_1_set']]):
+            idx = [state["atom_idx"][atom]
+                   for atom in f_set if atom in state["atom_idx"]]
+            side[idx] = f == 1
+            present[idx] = True
+        state["side"][rb] = side
+
+        idx_l, idx_r = state["idx_l"], state["idx_r"]
+        separated = (side[idx_l] ^ side[idx_r]) & present[idx_l] & present[idx_r]
+        # split the groups, numbered in the order of their first pair
+        key = state["group"] * 2 + separated
+        unique_key, first, inverse = np.unique(
+            key, return_index=True, return_inverse=True)
+        order = np.argsort(first)
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        state["group"] = rank[inverse.ravel()]
+        state["group_bonds"] = [state["group_bonds"][k // 2] + ([rb] if k % 2 else [])
+                                for k in unique_key[order].tolist()]
+        state["M"] = state["M"] + 1
+
+    def _build(self, M):
+        if self._state is None or self._state["M"] > M:
+            self._start()
+        while self._state["M"] < M:
+            self._advance()
+
+        state = self._state
+        rb_data = self._rb_data_list[M-1]
+        atoms = state["atoms"]
+        n = len(atoms)
+        group = state["group"]
+        group_keys = np.unique(np.concatenate(
+            [group * n + state["idx_l"], group * n + state["idx_r"]]))
+        group_start = np.searchsorted(
+            group_keys // n, np.arange(len(state["group_bonds"]) + 1)).tolist()
+        # the side of an atom is its side of the metrics bond of the group
+        side = np.array([state["side"][bond_group[0]] if len(bond_group) != 0 else np.zeros(n, dtype=bool)
+                         for bond_group in state["group_bonds"]])
+        key_side = side[group_keys // n, group_keys % n].tolist()
+        key_atom = [atoms[atom] for atom in (group_keys % n).tolist()]
 
+        ris_data = {}
+        for g, bond_group in enumerate(state["group_bonds"]):
             if len(bond_group) == 0:
-                return
-
+                continue
             bond_name = ','.join(bond_group)
+            bc_num = [rb_data[rb]['bc_num'] for rb in bond_group]
+            group_keys = range(group_start[g], group_start[g+1])
+            ris_data[bond_name] = {}
+            ris_data[bond_name]['metrics'] = bond_group[0]
+            ris_data[bond_name]['f_0_set'] = {
+                key_atom[key] for key in group_keys if not key_side[key]}
+            ris_data[bond_name]['f_1_set'] = {
+                key_atom[key] for key in group_keys if key_side[key]}
+            ris_data[bond_name]['avg_bc_num'] = sum(bc_num)/len(bc_num)
+            ris_data[bond_name]['rb_count_num'] = len(bc_num)
 
-            if bond_name not in ris_data.keys():
-                ris_data[bond_name] = {}
-                ris_data[bond_name]['metrics'] = bond_group[0]
-                ris_data[bond_name]['f_0_set'] = set()
-                ris_data[bond_name]['f_1_set'] = set()
-                # update bc score
-                update_bc_info(ris_data[bond_name], rb_data, bond_group)
-
-            for atom in candidate_pair:
-                side = judge_side_by_metrics(
-                    rb_data[ris_data[bond_name]['metrics']], atom)
-                ris_data[bond_name]['f_{}_set'.format(side)].add(atom)
-
-        for atom_l in range(1, self.atom_num+1):
-            for atom_r in range(atom_l+1, self.atom_num+1):
-                candidate_pair = (str(atom_l), str(atom_r))
-                update_ris_data(ris_data, rb_data, candidate_pair)
-        #         print("{}-{}".format(atom_l, atom_r))
-
-        # sorted(ris_data, key=lambda ris: (ris['rb_count_num']))
         # sort by num of bond at first (from small to large)
         # sort by bc_num at second ( from large to small)
-        sor_ris_data = {k: v for k, v in sorted(ris_data.items(), key=lambda ris: (
+        return {k: v for k, v in sorted(ris_data.items(), key=lambda ris: (
             ris[1]['rb_count_num'], -ris[1]['avg_bc_num']))}
-        return sor_ris_data
+
+
+"""
+    The fragments of the bridges by one depth-first search: the subtree of the lower end of a
+    bridge in the search tree is the side of the bridge away from the root, so the two sides of
+    every bridge are a slice of the preorder and its complement in the component. The fragments
+    of an edge are listed like nx.connected_components of the graph without the edge.
+    An edge in a ring is not a bridge and has no fragments, also in a graph of several components
+    where the graph without the edge still has two components.
+"""
+
+
+def bridge_fragments(graph, edges):
+    nodes = list(graph.nodes)
+    position = {node: i for i, node in enumerate(nodes)}
+    order = []
+    tin = {}
+    low = {}
+    size = {}
+    root_of = {}
+    # bridge -> the end of the bridge away from the root
+    bridges = {}
+    for root in nodes:
+        if root in tin:
+            continue
+        tin[root] = low[root] = len(order)
+        order.append(root)
+        root_of[root] = root
+        stack = [(root, None, iter(graph[root]))]
+        while len(stack) != 0:
+            node, parent, neighbors = stack[-1]
+            for neighbor in neighbors:
+                if neighbor == parent:
+                    continue
+                if neighbor in tin:
+                    low[node] = min(low[node], tin[neighbor])
+                else:
+                    tin[neighbor] = low[neighbor] = len(order)
+                    order.append(neighbor)
+                    root_of[neighbor] = root
+                    stack.append((neighbor, node, iter(graph[neighbor])))
+                    break
+            else:
+                stack.pop()
+                size[node] = len(order) - tin[node]
+                if parent is not None:
+                    low[parent] = min(low[parent], low[node])
+                    if low[node] > tin[parent]:
+                        bridges[frozenset((parent, node))] = node
+
+    # the components in the order of their first node, which is the root
+    roots = list(dict.fromkeys(root_of.values()))
+
+    fragments = {}
+    for edge in edges:
+        key = frozenset(edge)
+        if key not in bridges or key in fragments:
+            continue
+        child = bridges[key]
+        root = root_of[child]
+        child_side = order[tin[child]:tin[child]+size[child]]
+        f_child = set(child_side)
+        f_root = set(order[tin[root]:tin[root]+size[root]]) - f_child
+        child_first = min(position[node] for node in child_side)
+        # the other components are unchanged
+        pieces = [(position[other], set(order[tin[other]:tin[other]+size[other]]))
+                  for other in roots if other != root]
+        pieces.append((position[root], f_root))
+        pieces.append((child_first, f_child))
+        fragments[key] = [piece for _, piece in sorted(
+            pieces, key=lambda piece: piece[0])]
+    return fragments
@@ -6,95 +6,568 @@
 ########################################################################################################################
 
 
-from biopandas.mol2 import PandasMol2
-import pandas as pd
 import numpy as np
-import re
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
 
 import logging
 import pickle  # nosec
 import os
 
 from .GraphModel import BuildMolGraph
+from .DataStore import DataStore, save_store, is_store
 
 log = logging.getLogger()
 log.setLevel('INFO')
 
+BOND_COLUMNS = ['atom1', 'atom2', 'bond_type']
+
+# https://en.wikipedia.org/wiki/Van_der_Waals_radius
+VAN_DER_WAALS_DICT = {'H': 1.2, 'C': 1.7, 'N': 1.55,
+                      'O': 1.52, 'F': 1.47, 'S': 1.8, 'Ch': 1.75, 'Co': 1.4, 'Cl': 1.75,
+                      'P': 1.8, 'Br': 1.85, 'I': 1.98}
+# the other elements of the sdf and pdb files: Bondi (1964), the main group elements Bondi
+# does not list from Mantina et al. (2009) and Fe, Mn from Alvarez (2013)
+VAN_DER_WAALS_DICT.update({'Li': 1.82, 'Na': 2.27, 'K': 2.75, 'Mg': 1.73, 'Ni': 1.63, 'Cu': 1.4,
+                           'Zn': 1.39, 'Ga': 1.87, 'Si': 2.1, 'As': 1.85, 'Se': 1.9, 'Te': 2.06,
+                           'Pd': 1.63, 'Ag': 1.72, 'Cd': 1.58, 'In': 1.93, 'Sn': 2.17, 'Pt': 1.75,
+                           'Au': 1.66, 'Hg': 1.55, 'Tl': 1.96, 'Pb': 2.02, 'He': 1.4, 'Ne': 1.54,
+                           'Ar': 1.88, 'Kr': 2.02, 'Xe': 2.16,
+                           'Be': 1.53, 'B': 1.92, 'Al': 1.84, 'Ca': 2.31, 'Ge': 2.11, 'Sb': 2.06,
+                           'Bi': 2.07, 'Sr': 2.49, 'Ba': 2.68, 'Rb': 3.03, 'Cs': 3.43,
+                           'Fe': 2.44, 'Mn': 2.45})
+
 
 class MoleculeData():
+    """
+        The atoms and the bonds are kept as columns of arrays, atom_arrays and bond_arrays.
+        atom_data ({atom_id: {column: value}}) and bond (pandas DataFrame indexed by bond_id)
+        are built from the arrays when they are first used.
+    """
 
-    def __init__(self, mol_file, function, name=None):
-        # parse file
+    def __init__(self, mol_file, function, name=None, index=0):
+        # parse file, index is the molecule in a multi-molecule file
         self.mol = None
         self.name = None
         file_type = mol_file.split('.')[-1]
 
         if name == None:
             self.name = mol_file.split('/')[-1].split('.')[0]
+            if index != 0:
+                self.name = f"{self.name}_{index}"
         else:
             self.name = name
 
-        if file_type == 'mol2':
-            logging.info("parse mol2 file!")
-            self.mol = PandasMol2().read_mol2(mol_file)
-            self.bond = self.bond_parset(mol_file)
-
-            self.atom_num = self.mol.df['atom_id'].max()
-            self.atom_data = self.atom_parset()
-            self._add_van_der_waals()
-            self.bond_graph = BuildMolGraph(self.bond, self.atom_num)
+        if file_type in MOLECULE_READERS:
+            logging.info(f"parse {file_type} file!")
+            for n, record in enumerate(MOLECULE_READERS[file_type](mol_file)):
+                if n == index:
+                    break
+            else:
+                raise Exception(
+                    f"molecule {index} not found in {mol_file} !")
+            self._init_record(record)
         else:
             logging.error(
-                "file type {} not supported! only support mol2,pdb".format(file_type))
+                "file type {} not supported! only support {}".format(file_type, ",".join(MOLECULE_READERS.keys())))
             raise Exception("file type not supported!")
 
+    @classmethod
+    def from_record(cls, record, function, name):
+        # record: a molecule of read_mol2
+        mol_data = cls.__new__(cls)
+        mol_data.mol = None
+        mol_data.name = name
+        mol_data._init_record(record)
+        return mol_data
+
+    def _init_record(self, record):
+        self.atom_arrays = record["atom_arrays"]
+        self.bond_arrays = record["bond_arrays"]
+
+        self.atom_num = self.atom_arrays['atom_id'].astype(np.int64).max()
+        self._add_van_der_waals()
+        self.bond_graph = BuildMolGraph(self.bond_arrays, self.atom_num)
+
     def _add_van_der_waals(self):
-        # https://en.wikipedia.org/wiki/Van_der_Waals_radius
-        van_der_waals_dict = {'H': 1.2, 'C': 1.7, 'N': 1.55,
-                              'O': 1.52, 'F': 1.47, 'S': 1.8, 'Ch': 1.75, 'Co': 1.4, 'Cl': 1.75}
-
-        def _parse_atom(atom_type):
-            return atom_type.split('.')[0]
-
-        for pt, info in self.atom_data.items():
-            self.atom_data[pt]['vdw-radius'] = van_der_waals_dict[_parse_atom(
-                self.atom_data[pt]['atom_type'])]
-
-    def bond_parset(self, filename):
-        with open(filename, 'r') as f:
-            f_text = f.read()
-    #     print(f_text)
-        search_result = re.search(r'@<TRIPOS>BOND([a-z0-9\s]*)', f_text)
-    #     print("research result {}".format(search_result))
-        group_result = search_result.group(1)
-    #     print("group result {}".format(group_result))
-        bonds = np.array(re.sub(
-            r'\s+', ' ', re.search(r'@<TRIPOS>BOND([a-z0-9\s]*)', f_text).group(1)).split()).reshape((-1, 4))
-
-        df_bonds = pd.DataFrame(
-            bonds, columns=['bond_id', 'atom1', 'atom2', 'bond_type'])
-        df_bonds.set_index(['bond_id'], inplace=True)
-        return df_bonds
-
-    def atom_parset(self):
-        self.mol.df['atom_id'] = self.mol.df.atom_id.astype('str')
-        return self.mol.df.set_index('atom_id').T.to_dict('dict')
+        elements = [atom_type.split('.')[0]
+                    for atom_type in self.atom_arrays['atom_type'].tolist()]
+        unknown = sorted(set(elements) - VAN_DER_WAALS_DICT.keys())
+        if len(unknown) != 0:
+            raise Exception(
+                f"no van der waals radius of the elements {','.join(unknown)} in {self.name} !")
+        self.atom_arrays['vdw-radius'] = np.array(
+            [VAN_DER_WAALS_DICT[element] for element in elements], dtype=np.float64)
+
+    def __getattr__(self, name):
+        # the dict views are built on first use, the loaded pickles of the old versions have them already
+        if name == 'atom_data':
+            self.atom_data = _atom_data(self.atom_arrays)
+            return self.atom_data
+        if name == 'bond':
+            self.bond = _bond_frame(self.bond_arrays)
+            return self.bond
+        raise AttributeError(name)
 
     def save(self, version, path=None):
         save_path = None
-        save_name = f"qmu_{self.name}_data_{version}.pickle"
+        save_name = f"qmu_{self.name}_data_{version}"
 
         if path != None:
             save_path = os.path.join(path, save_name)
         else:
             save_path = os.path.join(".", save_name)
 
-        with open(save_path, "wb") as f:
-            pickle.dump(self, f)
+        meta, arrays = self._store_data()
+        save_store(save_path, "MoleculeData", meta, arrays)
         logging.info(f"finish save {save_name}")
         return save_path
 
+    def _store_data(self, prefix=""):
+        # the atom table and the bond table as arrays, the graph model as json
+        arrays = {}
+        for column, values in self.atom_arrays.items():
+            arrays[f"{prefix}atom_{column}"] = values
+        for column, values in self.bond_arrays.items():
+            arrays[f"{prefix}bond_{column}"] = values
+
+        meta = {}
+        meta["name"] = self.name
+        meta["atom_num"] = self.atom_num
+        meta["atom_columns"] = [
+            column for column in self.atom_arrays.keys() if column != 'atom_id']
+        meta["bond_columns"] = [
+            column for column in self.bond_arrays.keys() if column != 'bond_id']
+        meta["bond_graph"] = self.bond_graph.to_dict()
+        return meta, arrays
+
     @classmethod
     def load(cls, filename):
+        if is_store(filename):
+            store = DataStore(filename, "MoleculeData")
+            return cls._from_store(store, store.meta)
+        # data saved as pickle by the previous versions
         with open(filename, "rb") as f:
-            return pickle.load(f)  # nosec
+            mol_data = pickle.load(f)  # nosec
+        if 'atom_arrays' not in mol_data.__dict__:
+            mol_data.atom_arrays, mol_data.bond_arrays = _arrays_from_views(
+                mol_data.atom_data, mol_data.bond)
+        if 'exclusion' not in mol_data.bond_graph.__dict__:
+            mol_data.bond_graph.exclusion = mol_data.bond_graph.build_exclusion()
+        if 'exclusion_key' not in mol_data.bond_graph.__dict__:
+            mol_data.bond_graph.exclusion_key = mol_data.bond_graph.build_exclusion_key()
+        return mol_data
+
+    @classmethod
+    def _from_store(cls, store, meta, prefix=""):
+        mol_data = cls.__new__(cls)
+        # the parsed mol2 frame is not saved
+        mol_data.mol = None
+        mol_data.name = meta["name"]
+        mol_data.atom_num = meta["atom_num"]
+
+        mol_data.atom_arrays = {column: store.array(f"{prefix}atom_{column}")
+                                for column in ['atom_id'] + meta["atom_columns"]}
+        mol_data.bond_arrays = {column: store.array(f"{prefix}bond_{column}")
+                                for column in ['bond_id'] + meta["bond_columns"]}
+        mol_data.bond_graph = BuildMolGraph.from_dict(
+            meta["bond_graph"], mol_data.bond_arrays)
+        return mol_data
+
+
+class MoleculeLibrary():
+    """
+        The molecules of a multi-molecule file, or of all the molecule files in a directory,
+        as MoleculeData in the order of the files. The molecules are parsed when they are
+        iterated, one file after the other and one molecule at a time, with workers > 1 the
+        graph building runs in a process pool. save() writes all the molecules to one store,
+        load() reads them back one at a time.
+    """
+
+    def __init__(self, path, function, workers=1, chunk_size=16):
+        # workers: number of processes, None for all the cores
+        self.path = path
+        self.function = function
+        self.workers = os.cpu_count() if workers is None else workers
+        self.chunk_size = chunk_size
+        self.name = os.path.basename(os.path.normpath(path)).split('.')[0]
+
+        self._store = None
+        self._molecules = None
+        self._bond_graphs = None
+
+    def _sources(self):
+        if not os.path.isdir(self.path):
+            return [self.path]
+        return [os.path.join(self.path, file_name) for file_name in sorted(os.listdir(self.path))
+                if file_name.split('.')[-1] in MOLECULE_READERS]
+
+    def _tasks(self):
+        # the molecules of each file in chunks, the files are read only when their chunks are reached
+        for source in self._sources():
+            records = []
+            start = 0
+            for record in MOLECULE_READERS[source.split('.')[-1]](source):
+                records.append(record)
+                if len(records) == self.chunk_size:
+                    yield {"source": source, "start": start, "records": records, "function": self.function}
+                    start = start + len(records)
+                    records = []
+            if len(records) != 0:
+                yield {"source": source, "start": start, "records": records, "function": self.function}
+
+    def __iter__(self):
+        if self._store is not None:
+            for n in range(len(self)):
+                yield self[n]
+            return
+
+        if self.workers <= 1:
+            for source in self._sources():
+                records = MOLECULE_READERS[source.split('.')[-1]](source)
+                for index, record in enumerate(records):
+                    yield MoleculeData.from_record(record, self.function, _molecule_name(source, index))
+            return
+
+        # keep a few tasks ahead of the molecules used
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            for task in self._tasks():
+                pending.append(executor.submit(_library_task, task))
+                if len(pending) >= 2 * self.workers:
+                    for mol_data in pending.popleft().result():
+                        yield mol_data
+            while len(pending) != 0:
+                for mol_data in pending.popleft().result():
+                    yield mol_data
+
+    def __len__(self):
+        if self._store is None:
+            # the number of molecules is only known after save() or load()
+            raise TypeError("the library is not loaded from a store !")
+        return len(self._molecules)
+
+    def __getitem__(self, n):
+        if self._store is None:
+            raise Exception("only the saved library supports indexing !")
+        atom_offset = self._store.array("atom_offset")
+        bond_offset = self._store.array("bond_offset")
+        store = _StoreSlice(self._store, {"atom": slice(int(atom_offset[n]), int(atom_offset[n+1])),
+                                          "bond": slice(int(bond_offset[n]), int(bond_offset[n+1]))})
+        meta = dict(self._molecules[n])
+        if "bond_graph" in meta:
+            meta["bond_graph"] = self._store.document(meta["bond_graph"])
+        else:
+            # the stores saved before one document per molecule
+            if self._bond_graphs is None:
+                self._bond_graphs = self._store.document("bond_graph")
+            meta["bond_graph"] = self._bond_graphs[n]
+        return MoleculeData._from_store(store, meta)
+
+    def save(self, version, path=None):
+        save_path = None
+        save_name = f"qmu_{self.name}_library_{version}"
+
+        if path != None:
+            save_path = os.path.join(path, save_name)
+        else:
+            save_path = os.path.join(".", save_name)
+
+        # the molecules one after the other in the arrays, with the offsets of each molecule
+        molecules = []
+        bond_graphs = {}
+        columns = {}
+        offsets = {"atom": [0], "bond": [0]}
+        for mol_data in self:
+            meta, arrays = mol_data._store_data()
+            # the bond graph of each molecule in its own document
+            document_name = f"bond_graph_{len(molecules)}"
+            bond_graphs[document_name] = meta["bond_graph"]
+            meta["bond_graph"] = document_name
+            molecules.append(meta)
+            for name, array in arrays.items():
+                columns.setdefault(name, []).append(array)
+            offsets["atom"].append(
+                offsets["atom"][-1] + len(mol_data.atom_arrays['atom_id']))
+            offsets["bond"].append(
+                offsets["bond"][-1] + len(mol_data.bond_arrays['bond_id']))
+
+        arrays = {name: np.concatenate(values)
+                  for name, values in columns.items()}
+        arrays["atom_offset"] = np.array(offsets["atom"], dtype=np.int64)
+        arrays["bond_offset"] = np.array(offsets["bond"], dtype=np.int64)
+        meta = {"name": self.name, "function": self.function,
+                "source": self.path, "molecules": molecules}
+        save_store(save_path, "MoleculeLibrary", meta, arrays, bond_graphs)
+        logging.info(f"finish save {save_name} with {len(molecules)} molecules")
+        return save_path
+
+    @classmethod
+    def load(cls, filename):
+        store = DataStore(filename, "MoleculeLibrary")
+        library = cls(store.meta["source"], store.meta["function"])
+        library.name = store.meta["name"]
+        library._store = store
+        library._molecules = store.meta["molecules"]
+        return library
+
+
+class _StoreSlice():
+    # the arrays of a molecule in the store of a library
+    def __init__(self, store, slices):
+        self._store = store
+        self._slices = slices
+
+    def array(self, name):
+        return self._store.array(name)[self._slices[name.split('_')[0]]]
+
+
+def _molecule_name(source, index):
+    # the names of MoleculeData(mol_file, function, index=index)
+    base = source.split('/')[-1].split('.')[0]
+    return base if index == 0 else f"{base}_{index}"
+
+
+def _library_task(task):
+    return [MoleculeData.from_record(record, task["function"], _molecule_name(task["source"], index))
+            for index, record in enumerate(task["records"], task["start"])]
+
+
+"""
+    The mol2 files are read line by line, each molecule of the file is a record of
+    atom_arrays ({column: array}, the columns of biopandas) and bond_arrays.
+    The optional columns of the atoms are filled with the defaults of the mol2 format.
+"""
+
+
+def read_mol2(mol_file):
+    with open(mol_file, 'r') as f:
+        record = None
+        section = None
+        for line in f:
+            if line.startswith('@<TRIPOS>'):
+                section = line.strip()[len('@<TRIPOS>'):]
+                if section == 'MOLECULE':
+                    if record is not None:
+                        yield _mol2_record(record)
+                    record = {"name": None, "atoms": [], "bonds": []}
+                continue
+            fields = line.split()
+            if record is None or len(fields) == 0 or line.startswith('#'):
+                continue
+            if section == 'MOLECULE' and record["name"] is None:
+                record["name"] = line.strip()
+            elif section == 'ATOM':
+                record["atoms"].append(fields)
+            elif section == 'BOND':
+                record["bonds"].append(fields[:4])
+        if record is not None:
+            yield _mol2_record(record)
+
+
+def _mol2_record(record):
+    atoms = [fields[:9] + ['1', '****', '0.0'][max(len(fields) - 6, 0):]
+             for fields in record["atoms"]]
+    atoms = np.array(atoms, dtype=str).reshape((-1, 9))
+    bonds = np.array(record["bonds"], dtype=str).reshape((-1, 4))
+
+    atom_arrays = {}
+    atom_arrays['atom_id'] = atoms[:, 0].astype(np.int64).astype(str)
+    atom_arrays['atom_name'] = atoms[:, 1]
+    for n, column in enumerate(['x', 'y', 'z']):
+        atom_arrays[column] = atoms[:, 2+n].astype(np.float64)
+    atom_arrays['atom_type'] = atoms[:, 5]
+    atom_arrays['subst_id'] = atoms[:, 6].astype(np.int64)
+    atom_arrays['subst_name'] = atoms[:, 7]
+    atom_arrays['charge'] = atoms[:, 8].astype(np.float64)
+
+    bond_arrays = {}
+    bond_arrays['bond_id'] = bonds[:, 0]
+    for n, column in enumerate(BOND_COLUMNS):
+        bond_arrays[column] = bonds[:, 1+n]
+    return {"name": record["name"], "atom_arrays": atom_arrays, "bond_arrays": bond_arrays}
+
+
+"""
+    The sdf (V2000) and the pdb files are read by their fixed columns into the same records,
+    the atoms are numbered from 1 in the order of the file. The atom_type is the element,
+    the aromatic bonds of sdf (4) are 'ar' and the bonds of pdb are the CONECT records,
+    with the number of times a bond is listed as its order. The CONECT records of a pdb file
+    usually follow the last model, they are collected from the whole file and the bonds
+    are added to every model by the atom serial numbers.
+"""
+
+
+def read_sdf(mol_file):
+    with open(mol_file, 'r') as f:
+        lines = []
+        for line in f:
+            if line.startswith('$$$$'):
+                if len(lines) != 0:
+                    yield _sdf_record(lines)
+                lines = []
+            else:
+                lines.append(line.rstrip('\r\n'))
+        if any(line.strip() != '' for line in lines):
+            yield _sdf_record(lines)
+
+
+def _sdf_record(lines):
+    name = lines[0].strip()
+    counts = lines[3]
+    if 'V3000' in counts:
+        raise Exception(f"sdf V3000 of {name} not supported !")
+    atom_count = int(counts[0:3])
+    bond_count = int(counts[3:6])
+    # charge code of the atom block: 1 -> +3, ..., 7 -> -3
+    charge_code = {1: 3.0, 2: 2.0, 3: 1.0, 5: -1.0, 6: -2.0, 7: -3.0}
+
+    atoms = []
+    element_count = {}
+    for line in lines[4:4+atom_count]:
+        element = line[31:34].strip()
+        element_count[element] = element_count.get(element, 0) + 1
+        code = int(line[36:39]) if line[36:39].strip() != '' else 0
+        atoms.append([f"{element}{element_count[element]}", line[0:10], line[10:20], line[20:30],
+                      element, 1, name if name != '' else '****', charge_code.get(code, 0.0)])
+    bonds = []
+    for line in lines[4+atom_count:4+atom_count+bond_count]:
+        bond_type = line[6:9].strip()
+        bonds.append((int(line[0:3]), int(line[3:6]),
+                      'ar' if bond_type == '4' else bond_type))
+    # the charges of the property block replace all the charges of the atom block
+    property_charge = None
+    for line in lines[4+atom_count+bond_count:]:
+        if line.startswith('M  END'):
+            break
+        if line.startswith('M  CHG'):
+            property_charge = {} if property_charge is None else property_charge
+            for k in range(int(line[6:9])):
+                entry = line[9+8*k:17+8*k]
+                property_charge[int(entry[:4])] = float(int(entry[4:]))
+    if property_charge is not None:
+        for n, atom in enumerate(atoms):
+            atom[7] = property_charge.get(n+1, 0.0)
+    return _molecule_record(name, atoms, bonds)
+
+
+def read_pdb(mol_file):
+    # the CONECT records are read first, the models are then read one at a time
+    with open(mol_file, 'r') as f:
+        conect = [line for line in f if line[0:6].strip() == 'CONECT']
+
+    with open(mol_file, 'r') as f:
+        record = None
+        for line in f:
+            tag = line[0:6].strip()
+            if tag in ('ATOM', 'HETATM'):
+                if record is None:
+                    record = {"name": None, "atoms": [], "serial": {}}
+                record["serial"][line[6:11].strip()] = len(record["atoms"]) + 1
+                record["atoms"].append(line)
+            elif tag == 'COMPND' and record is None:
+                name = line[10:].strip()
+                if name != '':
+                    record = {"name": name, "atoms": [], "serial": {}}
+            elif tag in ('ENDMDL', 'END') and record is not None and len(record["atoms"]) != 0:
+                yield _pdb_record(record, conect)
+                record = None
+        if record is not None and len(record["atoms"]) != 0:
+            yield _pdb_record(record, conect)
+
+
+def _pdb_element(line):
+    # the element columns, or the atom name: the element is right-justified in its first two columns
+    element = line[76:78].strip()
+    if element == '':
+        atom_name = line[12:16]
+        element = ''.join(c for c in atom_name[0:2] if c.isalpha())
+        if element == '' or (len(atom_name.strip()) == 4 and atom_name[0] == 'H'):
+            element = ''.join(c for c in atom_name if c.isalpha())[:1]
+    if element == '':
+        raise Exception(
+            f"no element of the pdb atom {line[6:11].strip()} !")
+    return element[0].upper() + element[1:].lower()
+
+
+def _pdb_record(record, conect):
+    name = record["name"] if record["name"] is not None else '****'
+    atoms = []
+    for line in record["atoms"]:
+        element = _pdb_element(line)
+        charge = line[78:80].strip()
+        charge = float(charge[-1] + charge[:-1]) if charge != '' else 0.0
+        atoms.append([line[12:16].strip(), line[30:38], line[38:46], line[46:54],
+                      element, int(line[22:26]), line[17:20].strip(), charge])
+
+    # a bond is listed by both of its atoms, the order is the number of times in one of them
+    count = {}
+    for line in conect:
+        atom_1 = record["serial"].get(line[6:11].strip())
+        for k in range(11, len(line.rstrip()), 5):
+            atom_2 = record["serial"].get(line[k:k+5].strip())
+            if atom_1 is None or atom_2 is None or atom_1 == atom_2:
+                continue
+            count[(atom_1, atom_2)] = count.get((atom_1, atom_2), 0) + 1
+    bonds = []
+    for (atom_1, atom_2), order in count.items():
+        if atom_1 < atom_2 or (atom_2, atom_1) not in count:
+            order = max(order, count.get((atom_2, atom_1), 0))
+            bonds.append((min(atom_1, atom_2), max(atom_1, atom_2), str(min(order, 3))))
+    bonds.sort()
+    return _molecule_record(name, atoms, bonds)
+
+
+def _molecule_record(name, atoms, bonds):
+    # atoms: [atom_name, x, y, z, atom_type, subst_id, subst_name, charge] of the atoms 1..N,
+    # bonds: [(atom1, atom2, bond_type)]
+    columns = list(zip(*atoms)) if len(atoms) != 0 else [[]] * 8
+    atom_arrays = {}
+    atom_arrays['atom_id'] = np.arange(1, len(atoms)+1).astype(str)
+    atom_arrays['atom_name'] = np.array(columns[0], dtype=str)
+    for n, column in enumerate(['x', 'y', 'z']):
+        atom_arrays[column] = np.array(columns[1+n], dtype=str).astype(np.float64)
+    atom_arrays['atom_type'] = np.array(columns[4], dtype=str)
+    atom_arrays['subst_id'] = np.array(columns[5], dtype=np.int64)
+    atom_arrays['subst_name'] = np.array(columns[6], dtype=str)
+    atom_arrays['charge'] = np.array(columns[7], dtype=np.float64)
+
+    bond_arrays = {}
+    bond_arrays['bond_id'] = np.arange(1, len(bonds)+1).astype(str)
+    for n, column in enumerate(BOND_COLUMNS):
+        bond_arrays[column] = np.array([bond[n] for bond in bonds], dtype=str)
+    return {"name": name, "atom_arrays": atom_arrays, "bond_arrays": bond_arrays}
+
+
+def _atom_data(atom_arrays):
+    columns = [column for column in atom_arrays.keys() if column != 'atom_id']
+    values = [atom_arrays[column].tolist() for column in columns]
+    return {pt: dict(zip(columns, info)) for pt, info in zip(atom_arrays['atom_id'].tolist(), zip(*values))}
+
+
+def _bond_frame(bond_arrays):
+    import pandas as pd
+    return pd.DataFrame({column: bond_arrays[column] for column in bond_arrays.keys() if column != 'bond_id'},
+                        index=pd.Index(bond_arrays['bond_id'], name='bond_id'))
+
+
+def _arrays_from_views(atom_data, bond):
+    atom_columns = list(next(iter(atom_data.values())).keys())
+    atom_arrays = {'atom_id': np.array(list(atom_data.keys()), dtype=str)}
+    for column in atom_columns:
+        atom_arrays[column] = np.array(
+            [info[column] for info in atom_data.values()])
+    bond_arrays = {'bond_id': np.array(bond.index, dtype=str)}
+    for column in bond.columns:
+        bond_arrays[column] = np.array(bond[column], dtype=str)
+    return atom_arrays, bond_arrays
+
+
+# readers of the molecule files by the file extension, reader(mol_file) yields the records of the molecules
+MOLECULE_READERS = {'mol2': read_mol2,
+                    'sdf': read_sdf, 'sd': read_sdf, 'mol': read_sdf,
+                    'pdb': read_pdb}
+
+
+def register_reader(file_type, reader):
+    MOLECULE_READERS[file_type] = reader
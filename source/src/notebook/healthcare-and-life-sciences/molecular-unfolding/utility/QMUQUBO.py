@@ -4,10 +4,15 @@
 ########################################################################################################################
 #   The following class is the construction of QUBO model
 ########################################################################################################################
-import dimod
-from .MolGeoCalc import update_pts_distance, get_same_direction_set
+from .MolGeoCalc import AtomPosData, RotationTable, update_pts_distance_tree, get_same_direction_set
+from .QUBOModel import QUBOModel, _model_store_data, _load_model
+from .MoleculeParser import MoleculeData
+from .DataStore import DataStore, LazyStoreDict, save_store, is_store
 
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import itertools
 import time
 import logging
 import pickle  # nosec
@@ -32,7 +37,10 @@ class QMUQUBO():
         # init model_qubo to store the qubo for model of different methods
         self.model_info = {}
         self.model_qubo = {}
-        self.atom_pos_data = {}
+        self.atom_pos_data = AtomPosData(self.mol_data.atom_data)
+        # distance hubo (and its qubo) for each {M}_{D}, reused by the models
+        # with different A and hubo_qubo_val
+        self.hubo_distances = {}
         # define vars/var_rb_map/rb_var_map for different models
         self.var = None
         self.var_rb_map = None
@@ -54,76 +62,134 @@ class QMUQUBO():
                 logging.info(f"only pre-calculate(method='pre-calc') and after-calculate(method='after-calc') are supported, \
                 method {mt} not support !!")
 
-    def build_model(self, **param):
+    def build_model(self, workers=1, geometry="atom", **param):
+        # workers: number of processes to build the distance terms, None for all the cores
+        # geometry: "atom" rotates all the atoms for the distance terms, "centroid" only the
+        # fragment centroids and the axis atoms, see update_pts_distance_tree
+        if workers is None:
+            workers = os.cpu_count()
         for method, config in param.items():
             model_param = config
             if method == "pre-calc":
-                self._build_pre_calc_model(**model_param)
+                self._build_pre_calc_model(workers, geometry, **model_param)
         return 0
 
-    def _build_pre_calc_model(self, **model_param):
+    def _build_pre_calc_model(self, workers=1, geometry="atom", **model_param):
+        # the distance terms only depend on M and D, compute them once for each (M, D) cell
+        # and derive the models for A and hubo_qubo_val from them
+        cell_list = []
         for M in model_param["M"]:
             for D in model_param["D"]:
+                cell_models = []
                 for A in model_param["A"]:
                     for hubo_qubo_val in model_param["hubo_qubo_val"]:
-                        # update var_map
-                        # prepare variables
-                        self.var, self.var_rb_map, self.rb_var_map = self._prepare_var(
-                            self.mol_data, D)
                         model_name = f"{M}_{D}_{A}_{hubo_qubo_val}"
                         # check availability
-                        if model_name in self.model_qubo["pre-calc"].keys():
+                        if model_name in self.model_qubo["pre-calc"].keys() or (A, hubo_qubo_val) in cell_models:
                             logging.info(
                                 f"duplicate model !! pass !! M:{M},D:{D},A:{A},hubo_qubo_val {hubo_qubo_val}")
                             continue
-                        else:
-                            self._update_model_info([M, D, A, hubo_qubo_val], [
-                                                    "M", "D", "A", "hubo_qubo_val"], "pre-calc")
-                        start = time.time()
-                        hubo = {}
-                        theta_option = [x * 360/D for x in range(D)]
-                        hubo_constraints, hubo_distances = self._build_qubo_pre_calc(self.mol_data, M, D, A, self.var,
-                                                                                     self.rb_var_map, self.var_rb_map,
-                                                                                     theta_option)
-                        hubo.update(hubo_constraints)
-                        hubo.update(hubo_distances)
-                        # transfer hubo to qubo
-                        # TODO why make_quadratic not work?
-                        # qubo_raw = dimod.make_quadratic(
-                        #     hubo, hubo_qubo_val, dimod.BINARY).to_qubo()
-                        qubo_raw = dimod.make_quadratic(
-                            hubo, hubo_qubo_val, dimod.BINARY)
-                        qubo = self._manual_qubo(qubo_raw.to_qubo())
-                        end = time.time()
-
-                        self.model_qubo["pre-calc"][model_name] = {}
-                        self.model_qubo["pre-calc"][model_name]["qubo"] = qubo
-                        self.model_qubo["pre-calc"][model_name]["var"] = self.var
-                        self.model_qubo["pre-calc"][model_name]["var_rb_map"] = self.var_rb_map
-                        self.model_qubo["pre-calc"][model_name]["rb_var_map"] = self.rb_var_map
-                        self.model_qubo["pre-calc"][model_name]["time"] = end-start
-                        self.model_qubo["pre-calc"][model_name]["model_name"] = model_name
-                        ris_name = list(
-                            self.mol_data.bond_graph.sort_ris_data[str(M)].keys()).copy()
-                        valid_rb_name = []
-                        for name in ris_name:
-                            if len(name.split(',')) == 1:
-                                valid_rb_name.append(name)
-                        self.model_qubo["pre-calc"][model_name]["rb_name"] = valid_rb_name
-                        # # optimize results
-                        # self.model_qubo["pre-calc"][model_name]["optimizer"] = {}
-                        # self.model_qubo["pre-calc"][model_name]["optimizer"]["post"] = {}
-
-                        logging.info(
-                            f"Construct model for M:{M},D:{D},A:{A},hubo_qubo_val:{hubo_qubo_val} {(end-start)/60} min")
-
-    def _manual_qubo(self, qubo_raw):
-        qubo = defaultdict(float)
-
-        for key, value in qubo_raw[0].items():
-            qubo[key] = value
-
-        return qubo
+                        cell_models.append((A, hubo_qubo_val))
+                if len(cell_models) != 0 and (M, D) not in [cell[:2] for cell in cell_list]:
+                    cell_list.append((M, D, cell_models))
+
+        self._update_hubo_distances(
+            [(M, D) for M, D, _ in cell_list if self.hubo_distances.get(f"{M}_{D}", {}).get("geometry") != geometry], workers, geometry)
+
+        for M, D, cell_models in cell_list:
+            # update var_map
+            # prepare variables
+            self.var, self.var_rb_map, self.rb_var_map = self._prepare_var(
+                self.mol_data, D)
+
+            hubo_distances = self.hubo_distances[f"{M}_{D}"]["hubo"]
+            distance_time = self.hubo_distances[f"{M}_{D}"]["time"]
+
+            # the constraint is linear in A, keep the terms for A=1. The distance terms
+            # take precedence over the linear constraint terms on the same variable
+            hubo_penalty = {key: value for key, value in self._build_constraint_pre_calc(
+                self.mol_data, M, D, 1, self.var, self.rb_var_map).items() if key not in hubo_distances}
+
+            # quadratic distance terms, the constraints of the products are linear in hubo_qubo_val
+            if "qubo" not in self.hubo_distances[f"{M}_{D}"].keys():
+                start = time.time()
+                self.hubo_distances[f"{M}_{D}"]["qubo"] = reduce_hubo(
+                    hubo_distances)
+                end = time.time()
+                self.hubo_distances[f"{M}_{D}"]["time_qubo"] = end-start
+            qubo_objective, qubo_constraint = self.hubo_distances[f"{M}_{D}"]["qubo"]
+            reduce_time = self.hubo_distances[f"{M}_{D}"]["time_qubo"]
+
+            for A, hubo_qubo_val in cell_models:
+                model_name = f"{M}_{D}_{A}_{hubo_qubo_val}"
+                self._update_model_info([M, D, A, hubo_qubo_val], [
+                                        "M", "D", "A", "hubo_qubo_val"], "pre-calc")
+                start = time.time()
+                qubo = defaultdict(float, qubo_objective)
+                for key, value in qubo_constraint.items():
+                    qubo[key] += hubo_qubo_val * value
+                for key, value in hubo_penalty.items():
+                    qubo[key] += A * value
+                qubo = QUBOModel.from_qubo(qubo)
+                end = time.time()
+
+                self.model_qubo["pre-calc"][model_name] = {}
+                self.model_qubo["pre-calc"][model_name]["qubo"] = qubo
+                self.model_qubo["pre-calc"][model_name]["var"] = self.var
+                self.model_qubo["pre-calc"][model_name]["var_rb_map"] = self.var_rb_map
+                self.model_qubo["pre-calc"][model_name]["rb_var_map"] = self.rb_var_map
+                # time: distance terms of the (M, D) cell + qubo of this model
+                qubo_time = reduce_time + end-start
+                self.model_qubo["pre-calc"][model_name]["time"] = distance_time + qubo_time
+                self.model_qubo["pre-calc"][model_name]["time_distance"] = distance_time
+                self.model_qubo["pre-calc"][model_name]["time_qubo"] = qubo_time
+                self.model_qubo["pre-calc"][model_name]["model_name"] = model_name
+                ris_name = list(
+                    self.mol_data.bond_graph.sort_ris_data[str(M)].keys()).copy()
+                valid_rb_name = []
+                for name in ris_name:
+                    if len(name.split(',')) == 1:
+                        valid_rb_name.append(name)
+                self.model_qubo["pre-calc"][model_name]["rb_name"] = valid_rb_name
+                # # optimize results
+                # self.model_qubo["pre-calc"][model_name]["optimizer"] = {}
+                # self.model_qubo["pre-calc"][model_name]["optimizer"]["post"] = {}
+
+                logging.info(
+                    f"Construct model for M:{M},D:{D},A:{A},hubo_qubo_val:{hubo_qubo_val} {(distance_time+qubo_time)/60} min")
+
+    def _update_hubo_distances(self, cell_list, workers=1, geometry="atom"):
+        if workers > 1 and len(cell_list) > 1:
+            # run the (M, D) cells in parallel
+            cell_param = []
+            for M, D in cell_list:
+                var, _, rb_var_map = self._prepare_var(self.mol_data, D)
+                theta_option = [x * 360/D for x in range(D)]
+                cell_param.append((M, var, rb_var_map, theta_option, geometry))
+            with ProcessPoolExecutor(max_workers=min(workers, len(cell_list)), initializer=_init_cell_worker,
+                                     initargs=(self.mol_data,)) as executor:
+                cell_result = list(executor.map(_cell_worker, cell_param))
+        else:
+            cell_result = []
+            for M, D in cell_list:
+                var, _, rb_var_map = self._prepare_var(self.mol_data, D)
+                theta_option = [x * 360/D for x in range(D)]
+                start = time.time()
+                hubo_distances = self._build_distance_pre_calc(self.mol_data, M, var, rb_var_map,
+                                                               theta_option, workers, geometry)
+                end = time.time()
+                cell_result.append((hubo_distances, end-start))
+
+        for (M, D), (hubo_distances, distance_time) in zip(cell_list, cell_result):
+            self.hubo_distances[f"{M}_{D}"] = {}
+            self.hubo_distances[f"{M}_{D}"]["hubo"] = hubo_distances
+            self.hubo_distances[f"{M}_{D}"]["time"] = distance_time
+            self.hubo_distances[f"{M}_{D}"]["geometry"] = geometry
+            logging.info(
+                f"Construct distance terms for M:{M},D:{D} {distance_time/60} min")
+
+    def get_hubo_distances(self, M, D):
+        return self.hubo_distances[f"{M}_{D}"]["hubo"]
 
     def _update_model_info(self, values, names, method):
         for value, name in zip(values, names):
@@ -155,23 +221,81 @@ class QMUQUBO():
 
     def save(self, version, path=None):
         save_path = None
-        save_name = f"{self.name}_{version}.pickle"
+        save_name = f"{self.name}_{version}"
 
         if path != None:
             save_path = os.path.join(path, save_name)
         else:
             save_path = os.path.join(".", save_name)
 
-        with open(save_path, "wb") as f:
-            pickle.dump(self, f)
+        meta = {}
+        meta["name"] = self.name
+        meta["param"] = self.param
+        meta["model_info"] = self.model_info
+        documents = {}
+        documents["mol_data"], arrays = self.mol_data._store_data("mol_data_")
+        # index of the models, each model is a document and its arrays
+        meta["model_qubo"] = {}
+        model_num = 0
+        for method, models in self.model_qubo.items():
+            meta["model_qubo"][method] = {}
+            for model_name, model in models.items():
+                ref = f"model_{model_num}"
+                model_num = model_num + 1
+                documents[ref], qubo_arrays = _model_store_data(model, ref)
+                arrays.update(qubo_arrays)
+                meta["model_qubo"][method][model_name] = ref
+        # index of the distance terms of the (M, D) cells, reused by build_model after load
+        meta["hubo_distances"] = {}
+        for cell_num, (cell_name, cell) in enumerate(self.hubo_distances.items()):
+            ref = f"cell_{cell_num}"
+            documents[ref], cell_arrays = _cell_store_data(cell, ref)
+            arrays.update(cell_arrays)
+            meta["hubo_distances"][cell_name] = ref
+
+        save_store(save_path, "QMUQUBO", meta, arrays, documents)
         logging.info(f"finish save {save_name}")
         return save_path
 
     @classmethod
     def load(cls, filename):
+        if is_store(filename):
+            return cls._from_store(DataStore(filename, "QMUQUBO"))
+        # models saved as pickle by the previous versions
         with open(filename, "rb") as f:
             return pickle.load(f)  # nosec
 
+    @classmethod
+    def load_index(cls, filename):
+        # names of the saved models for each method, read without loading the models
+        store = DataStore(filename, "QMUQUBO")
+        return {method: list(index.keys()) for method, index in store.meta["model_qubo"].items()}
+
+    @classmethod
+    def _from_store(cls, store):
+        meta = store.meta
+
+        qmu_qubo = cls.__new__(cls)
+        qmu_qubo.param = meta["param"]
+        mol_meta = store.document(
+            "mol_data") if store.version >= 2 else meta["mol_data"]
+        qmu_qubo.mol_data = MoleculeData._from_store(
+            store, mol_meta, "mol_data_")
+        qmu_qubo.name = meta["name"]
+        qmu_qubo.model_info = {method: {param: set(value) for param, value in info.items()}
+                               for method, info in meta["model_info"].items()}
+        # the models are loaded by get_model
+        qmu_qubo.model_qubo = {method: LazyStoreDict(store, index, _load_model)
+                               for method, index in meta["model_qubo"].items()}
+        qmu_qubo.atom_pos_data = AtomPosData(qmu_qubo.mol_data.atom_data)
+        # the distance cells are loaded when a model of the cell is built
+        qmu_qubo.hubo_distances = LazyStoreDict(
+            store, meta.get("hubo_distances", {}), _load_cell)
+        qmu_qubo.var = None
+        qmu_qubo.var_rb_map = None
+        qmu_qubo.rb_var_map = None
+        return qmu_qubo
+
     def _prepare_var(self, mol_data, D):
 
         var = {}
@@ -189,13 +313,9 @@ class QMUQUBO():
         return var, var_rb_map, rb_var_map
 
     def _init_mol_file(self):
-        for pt, info in self.mol_data.atom_data.items():
-            self.atom_pos_data[pt] = {}
-            self.atom_pos_data[pt]['pts'] = [info['x'], info['y'], info['z']]
-            self.atom_pos_data[pt]['idx'] = ([0, 0, 0], [0, 0, 0])
-            self.atom_pos_data[pt]['vdw-radius'] = info['vdw-radius']
+        self.atom_pos_data.reset()
 
-    def _build_qubo_pre_calc(self, mol_data, M, D, A, var, rb_var_map, var_rb_map, theta_option):
+    def _build_constraint_pre_calc(self, mol_data, M, D, A, var, rb_var_map):
         # initial constraint
         hubo_constraints = {}
 
@@ -212,77 +332,264 @@ class QMUQUBO():
                     else:
                         hubo_constraints[(var_1, var_2)] = A
 
-        # update distance term
-        hubo_distances = {}
-
-        def _gen_pts_pos_list(pt_set, atom_pos_data):
-            return [atom_pos_data[pt]['pts'] for pt in pt_set]
-
-        def _gen_pts_list(pt_set, atom_pos_data):
-            return [atom_pos_data[pt] for pt in pt_set]
-
-        def update_hubo(torsion_group, up_list, ris):
-            if len(torsion_group) == 1:
-                for d in range(D):
-                    tor_list = up_list + \
-                        [var[rb_var_map[torsion_group[0]]][str(d+1)]]
-                    # distance
-                    final_list_name = []
-                    if len(tor_list) == 1:
-                        final_list_name = tor_list + tor_list
-                    else:
-                        final_list_name = tor_list
-
-                    # update temp points and distance
-                    self._init_mol_file()
-
-                    rb_set = self.mol_data.bond_graph.sort_ris_data[str(
-                        M)][ris]
-
-                    # build map for affected tor
-                    tor_map = {}
-                    tor_len = len(tor_list)
-                    for base_idx in range(tor_len):
-                        tor_name = tor_list[base_idx]
-                        tor_map[tor_name] = set()
-                        base_rb_name = var_rb_map[tor_list[base_idx].split('_')[
-                            1]]
-
-                        # get direction set
-                        direction_set = get_same_direction_set(
-                            rb_set['f_1_set'], self.mol_data.bond_graph.rb_data, base_rb_name)
-
-                        for candi_idx in range(base_idx, tor_len):
-                            candi_rb_name = var_rb_map[tor_list[candi_idx].split('_')[
-                                1]].split('+')
-                            for rb in candi_rb_name:
-                                if rb in direction_set:
-                                    tor_map[tor_name].add(rb)
-
-                    distance = update_pts_distance(
-                        self.atom_pos_data, rb_set, tor_map, var_rb_map, theta_option, True, True)
-
-                    hubo_distances[tuple(final_list_name)] = -distance
-                    logging.debug(
-                        f"final list {tor_list} with distance {distance}")
-            else:
-                for d in range(D):
-                    final_list = up_list + \
-                        [var[rb_var_map[torsion_group[0]]][str(d+1)]]
-                    update_hubo(torsion_group[1:], final_list, ris)
-
         for ris in mol_data.bond_graph.sort_ris_data[str(M)].keys():
-            start = time.time()
-            logging.debug(f"ris group {ris} ")
-            end = time.time()
             torsion_group = ris.split(",")
             if len(torsion_group) == 1:
                 # update constraint
                 update_constraint(ris, hubo_constraints)
-            logging.debug(torsion_group)
-            # update hubo terms
-            update_hubo(torsion_group, [], ris)
-            logging.debug(
-                f"elapsed time for torsion group {ris} : {(end-start)/60} min")
 
-        return hubo_constraints, hubo_distances
+        return hubo_constraints
+
+    def _build_distance_pre_calc(self, mol_data, M, var, rb_var_map, theta_option, workers=1, geometry="atom"):
+        ris_list = list(mol_data.bond_graph.sort_ris_data[str(M)].keys())
+
+        if workers > 1 and len(ris_list) > 1:
+            # update distance term
+            hubo_distances = {}
+            # the ris groups are independent, merge them in order
+            with ProcessPoolExecutor(max_workers=min(workers, len(ris_list)), initializer=_init_ris_worker,
+                                     initargs=(mol_data, M, var, rb_var_map, theta_option, geometry)) as executor:
+                for ris_hubo_distances in executor.map(_ris_worker, ris_list):
+                    hubo_distances.update(ris_hubo_distances)
+            return hubo_distances
+
+        return _build_hubo_distances(mol_data, M, var, rb_var_map, theta_option, self.atom_pos_data, geometry)
+
+
+def _build_hubo_distances(mol_data, M, var, rb_var_map, theta_option, atom_pos_data, geometry="atom"):
+    # update distance term
+    hubo_distances = {}
+
+    rot_table = RotationTable(theta_option)
+    for ris in mol_data.bond_graph.sort_ris_data[str(M)].keys():
+        start = time.time()
+        logging.debug(f"ris group {ris} ")
+        # update hubo terms
+        hubo_distances.update(_build_ris_hubo_distances(
+            mol_data, M, var, rb_var_map, ris, atom_pos_data, rot_table, geometry))
+        end = time.time()
+        logging.debug(
+            f"elapsed time for torsion group {ris} : {(end-start)/60} min")
+
+    return hubo_distances
+
+
+def _build_ris_hubo_distances(mol_data, M, var, rb_var_map, ris, atom_pos_data, rot_table, geometry="atom"):
+    hubo_distances = {}
+
+    torsion_group = ris.split(",")
+    logging.debug(torsion_group)
+
+    rb_set = mol_data.bond_graph.sort_ris_data[str(M)][ris]
+
+    # build map for affected tor, which does not depend on the angles
+    affect_set_list = []
+    for base_idx, base_rb_name in enumerate(torsion_group):
+        affect_set = set()
+
+        # get direction set
+        direction_set = get_same_direction_set(
+            rb_set['f_1_set'], mol_data.bond_graph.rb_data, base_rb_name)
+
+        for candi_rb_name in torsion_group[base_idx:]:
+            for rb in candi_rb_name.split('+'):
+                if rb in direction_set:
+                    affect_set.add(rb)
+        affect_set_list.append(affect_set)
+
+    # update temp points and distance for all the angles depth-first
+    atom_pos_data.reset()
+
+    for angle_list, distance in update_pts_distance_tree(atom_pos_data, rb_set, torsion_group,
+                                                         affect_set_list, rot_table, geometry):
+        tor_list = [var[rb_var_map[rb_name]][str(d+1)]
+                    for rb_name, d in zip(torsion_group, angle_list)]
+        # distance
+        final_list_name = []
+        if len(tor_list) == 1:
+            final_list_name = tor_list + tor_list
+        else:
+            final_list_name = tor_list
+
+        hubo_distances[tuple(final_list_name)] = -distance
+        logging.debug(
+            f"final list {tor_list} with distance {distance}")
+
+    return hubo_distances
+
+
+# data of the worker processes building the distance terms
+_ris_worker_data = {}
+
+
+def _init_ris_worker(mol_data, M, var, rb_var_map, theta_option, geometry="atom"):
+    _ris_worker_data["param"] = (mol_data, M, var, rb_var_map, geometry)
+    _ris_worker_data["atom_pos_data"] = AtomPosData(mol_data.atom_data)
+    _ris_worker_data["rot_table"] = RotationTable(theta_option)
+
+
+def _ris_worker(ris):
+    mol_data, M, var, rb_var_map, geometry = _ris_worker_data["param"]
+    return _build_ris_hubo_distances(mol_data, M, var, rb_var_map, ris,
+                                     _ris_worker_data["atom_pos_data"], _ris_worker_data["rot_table"], geometry)
+
+
+# data of the worker processes building the (M, D) cells
+_cell_worker_data = {}
+
+
+def _init_cell_worker(mol_data):
+    _cell_worker_data["mol_data"] = mol_data
+    _cell_worker_data["atom_pos_data"] = AtomPosData(mol_data.atom_data)
+
+
+def _cell_worker(cell_param):
+    M, var, rb_var_map, theta_option, geometry = cell_param
+    start = time.time()
+    hubo_distances = _build_hubo_distances(_cell_worker_data["mol_data"], M, var, rb_var_map,
+                                           theta_option, _cell_worker_data["atom_pos_data"], geometry)
+    end = time.time()
+    return hubo_distances, end-start
+
+
+"""
+    The distance cells of QMUQUBO are dicts with the distance hubo in "hubo" and the reduced qubo
+    (objective, constraint) in "qubo" once a model is built. In a store each cell is a json document
+    with the variables and the other items, and the arrays of the terms as indices of the variables:
+    the hubo terms padded with -1 and the biases, and the pairs and the biases of the two qubos.
+"""
+
+
+def _cell_store_data(cell, cell_name):
+    variables = {}
+
+    def _var_idx(term):
+        return [variables.setdefault(var, len(variables)) for var in term]
+
+    hubo = cell["hubo"]
+    term_len = max([len(term) for term in hubo.keys()], default=2)
+    hubo_term = np.full((len(hubo), term_len), -1, dtype=np.int32)
+    for n, term in enumerate(hubo.keys()):
+        hubo_term[n, :len(term)] = _var_idx(term)
+    arrays = {f"{cell_name}_hubo_term": hubo_term,
+              f"{cell_name}_hubo_bias": np.array(list(hubo.values()), dtype=np.float64)}
+
+    document = {key: value for key, value in cell.items()
+                if key not in ["hubo", "qubo"]}
+    if "qubo" in cell.keys():
+        for name, qubo in zip(["objective", "constraint"], cell["qubo"]):
+            arrays[f"{cell_name}_{name}_pair"] = np.array(
+                [_var_idx(pair) for pair in qubo.keys()], dtype=np.int32).reshape(-1, 2)
+            arrays[f"{cell_name}_{name}_bias"] = np.array(
+                list(qubo.values()), dtype=np.float64)
+    document["variables"] = list(variables.keys())
+    document["prefix"] = f"{cell_name}_"
+    return document, arrays
+
+
+def _load_cell(store, cell_ref):
+    document = store.document(cell_ref)
+    variables = document["variables"]
+    prefix = document["prefix"]
+
+    cell = {key: value for key, value in document.items()
+            if key not in ["variables", "prefix"]}
+    cell["hubo"] = {tuple(variables[idx] for idx in term if idx != -1): bias for term, bias in zip(
+        store.array(f"{prefix}hubo_term").tolist(), store.array(f"{prefix}hubo_bias").tolist())}
+    if f"{prefix}objective_pair" in store:
+        cell["qubo"] = tuple(defaultdict(float, {(variables[u], variables[v]): bias for (u, v), bias in zip(
+            store.array(f"{prefix}{name}_pair").tolist(), store.array(f"{prefix}{name}_bias").tolist())})
+            for name in ["objective", "constraint"])
+    return cell
+
+
+"""
+    Reduce the distance hubo to a qubo. The variables of a higher order term are one x_{m}_{d} for
+    each rotatable bond of a ris group, so the pairs of factors to replace by product variables are
+    chosen greedily by rotatable bonds (the most common pair first) instead of by variables.
+    Return the qubo of the reduced terms and the qubo of the product constraints (and gates) for
+    strength 1, the qubo for strength hubo_qubo_val is objective + hubo_qubo_val * constraint.
+"""
+
+
+def reduce_hubo(hubo):
+    qubo_objective = defaultdict(float)
+    qubo_constraint = defaultdict(float)
+
+    def _add_qubo(qubo, u, v, bias):
+        if (v, u) in qubo.keys():
+            qubo[(v, u)] += bias
+        else:
+            qubo[(u, v)] += bias
+
+    # group the higher order terms by the rotatable bonds of their variables
+    sig_terms = defaultdict(list)
+    for term, bias in hubo.items():
+        if len(term) > 2:
+            sig_terms[tuple(var.split('_')[1] for var in term)].append(
+                (term, bias))
+        else:
+            _add_qubo(qubo_objective, term[0], term[-1], bias)
+
+    # number of variables of each rotatable bond
+    rb_vars = defaultdict(set)
+    for sig, terms in sig_terms.items():
+        for term, _ in terms:
+            for rb, var in zip(sig, term):
+                rb_vars[rb].add(var)
+
+    # merge the pair of factors whose products are used by the most terms,
+    # until each term has two factors
+    sig_factors = {sig: [frozenset([rb]) for rb in sig]
+                   for sig in sig_terms.keys()}
+    sig_merge = {sig: [] for sig in sig_terms.keys()}
+    while True:
+        pair_count = defaultdict(int)
+        for sig, factors in sig_factors.items():
+            if len(factors) > 2:
+                for pair in itertools.combinations(factors, 2):
+                    pair_count[frozenset(pair)] += len(sig_terms[sig])
+        if len(pair_count) == 0:
+            break
+
+        def _pair_usage(pair):
+            product_num = 1
+            for rb in frozenset.union(*pair):
+                product_num = product_num * len(rb_vars[rb])
+            return pair_count[pair] / product_num
+
+        # ties broken by the bond names for a reproducible model
+        merge_pair = min(pair_count.keys(), key=lambda pair: (
+            -_pair_usage(pair), sorted(sorted(factor) for factor in pair)))
+        for sig, factors in sig_factors.items():
+            if len(factors) > 2 and merge_pair.issubset(factors):
+                f_1, f_2 = sorted(merge_pair, key=lambda factor: min(
+                    sig.index(rb) for rb in factor))
+                sig_merge[sig].append((f_1, f_2))
+                factors.remove(f_1)
+                factors.remove(f_2)
+                factors.append(f_1 | f_2)
+
+    # variables in the product -> product variable
+    products = {}
+    for sig, terms in sig_terms.items():
+        for term, bias in terms:
+            factor_var = {frozenset([rb]): var for rb, var in zip(sig, term)}
+            for f_1, f_2 in sig_merge[sig]:
+                u = factor_var.pop(f_1)
+                v = factor_var.pop(f_2)
+                product_key = frozenset(
+                    var for rb, var in zip(sig, term) if rb in f_1 or rb in f_2)
+                if product_key not in products.keys():
+                    # constraint p == u*v
+                    p = f"{u}*{v}"
+                    products[product_key] = p
+                    _add_qubo(qubo_constraint, u, v, 1)
+                    _add_qubo(qubo_constraint, u, p, -2)
+                    _add_qubo(qubo_constraint, v, p, -2)
+                    _add_qubo(qubo_constraint, p, p, 3)
+                factor_var[f_1 | f_2] = products[product_key]
+            u, v = factor_var.values()
+            _add_qubo(qubo_objective, u, v, bias)
+
+    return qubo_objective, qubo_constraint
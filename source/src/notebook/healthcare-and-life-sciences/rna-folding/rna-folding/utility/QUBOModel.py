@@ -0,0 +1,180 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+########################################################################################################################
+#   The following class is the sparse matrix representation of QUBO model
+########################################################################################################################
+import numpy as np
+from collections import defaultdict
+import logging
+
+try:
+    import scipy.sparse as sparse
+except ImportError:
+    sparse = None
+
+log = logging.getLogger()
+log.setLevel('INFO')
+
+
+class QUBOModel():
+    """
+        QUBO in the form of arrays instead of a dict of variable pairs.
+        The variables are indexed by their position in variables, the linear biases
+        are a vector and the couplings are an upper-triangular matrix (row < col) in
+        coordinate format, sorted by row and col without duplicates.
+    """
+
+    def __init__(self, variables, linear, row, col, data, offset=0.0):
+        self.variables = list(variables)
+        self.linear = np.asarray(linear, dtype=np.float64)
+        self.row = np.asarray(row, dtype=np.int32)
+        self.col = np.asarray(col, dtype=np.int32)
+        self.data = np.asarray(data, dtype=np.float64)
+        self.offset = offset
+        self._var_idx = None
+
+    @classmethod
+    def from_qubo(cls, qubo, offset=0.0):
+        # qubo: {(u, v): bias}, the variables are indexed in the order they appear
+        var_idx = {}
+        for u, v in qubo.keys():
+            if u not in var_idx:
+                var_idx[u] = len(var_idx)
+            if v not in var_idx:
+                var_idx[v] = len(var_idx)
+
+        n = len(qubo)
+        idx_1 = np.fromiter((var_idx[u] for u, _ in qubo.keys()),
+                            dtype=np.int32, count=n)
+        idx_2 = np.fromiter((var_idx[v] for _, v in qubo.keys()),
+                            dtype=np.int32, count=n)
+        bias = np.fromiter(qubo.values(), dtype=np.float64, count=n)
+
+        diag = idx_1 == idx_2
+        linear = np.bincount(
+            idx_1[diag], weights=bias[diag], minlength=len(var_idx))
+        row, col, data = _coalesce(len(var_idx), np.minimum(idx_1[~diag], idx_2[~diag]),
+                                   np.maximum(idx_1[~diag], idx_2[~diag]), bias[~diag])
+
+        return cls(var_idx.keys(), linear, row, col, data, offset)
+
+    @classmethod
+    def from_bqm(cls, bqm):
+        qubo, offset = bqm.to_qubo()
+        return cls.from_qubo(qubo, offset)
+
+    def to_qubo(self):
+        # the dict form, with the linear bias of every variable on the diagonal
+        qubo = defaultdict(float)
+        for var, bias in zip(self.variables, self.linear.tolist()):
+            qubo[(var, var)] = bias
+        for u, v, bias in zip(self.row.tolist(), self.col.tolist(), self.data.tolist()):
+            qubo[(self.variables[u], self.variables[v])] = bias
+        return qubo
+
+    def to_bqm(self):
+        import dimod
+        return dimod.BinaryQuadraticModel.from_numpy_vectors(
+            self.linear, (self.row, self.col, self.data), self.offset, dimod.BINARY,
+            variable_order=self.variables)
+
+    def _store_data(self, prefix=""):
+        # the labels are saved as strings
+        meta = {"offset": self.offset}
+        arrays = {}
+        arrays[f"{prefix}variables"] = np.array(self.variables, dtype=str)
+        arrays[f"{prefix}linear"] = self.linear
+        arrays[f"{prefix}row"] = self.row
+        arrays[f"{prefix}col"] = self.col
+        arrays[f"{prefix}data"] = self.data
+        return meta, arrays
+
+    @classmethod
+    def _from_store(cls, store, meta, prefix=""):
+        # the biases stay memory-mapped
+        return cls(store.array(f"{prefix}variables").tolist(), store.array(f"{prefix}linear"),
+                   store.array(f"{prefix}row"), store.array(f"{prefix}col"),
+                   store.array(f"{prefix}data"), meta["offset"])
+
+    def to_coo(self):
+        # the upper-triangular coupling matrix, the linear biases are not included
+        if sparse is None:
+            raise Exception("scipy is required for the sparse coupling matrix !")
+        return sparse.coo_matrix((self.data, (self.row, self.col)),
+                                 shape=(self.num_variables, self.num_variables))
+
+    def to_csr(self):
+        return self.to_coo().tocsr()
+
+    @property
+    def num_variables(self):
+        return len(self.variables)
+
+    @property
+    def num_interactions(self):
+        return len(self.data)
+
+    @property
+    def nbytes(self):
+        # memory of the biases, the variable labels are not counted
+        return self.linear.nbytes + self.row.nbytes + self.col.nbytes + self.data.nbytes
+
+    @property
+    def var_idx(self):
+        if self._var_idx is None:
+            self._var_idx = {var: n for n, var in enumerate(self.variables)}
+        return self._var_idx
+
+    def energies(self, samples):
+        # samples: (S, N) array of 0/1 in the order of variables
+        samples = np.atleast_2d(np.asarray(samples, dtype=np.float64))
+        return samples @ self.linear + \
+            (samples[:, self.row] * samples[:, self.col]) @ self.data + self.offset
+
+    def energy(self, sample):
+        # sample: {var: 0/1}
+        return self.energies([[sample[var] for var in self.variables]])[0]
+
+    def __len__(self):
+        return self.num_variables
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_var_idx"] = None
+        return state
+
+
+def _coalesce(n, row, col, data):
+    # sort the couplings by (row, col) and sum the duplicates
+    key = row.astype(np.int64) * n + col
+    order = np.argsort(key, kind="stable")
+    key = key[order]
+    unique_key, start = np.unique(key, return_index=True)
+    data = np.add.reduceat(data[order], start) if len(
+        start) != 0 else data[order]
+    return (unique_key // n).astype(np.int32), (unique_key % n).astype(np.int32), data
+
+
+"""
+    The models of QMUQUBO and RNAQUBO are dicts with the QUBOModel in "qubo". In a store each model
+    is a json document for the other items and the arrays of the QUBOModel, both named by
+    model_name, so a model can be loaded without reading the others.
+"""
+
+
+def _model_store_data(model, model_name):
+    document = {key: value for key, value in model.items() if key != "qubo"}
+    document["qubo"], arrays = model["qubo"]._store_data(f"{model_name}_")
+    document["qubo"]["prefix"] = f"{model_name}_"
+    return document, arrays
+
+
+def _load_model(store, model_ref):
+    # model_ref: document name, or the document itself in the version 1 stores
+    document = store.document(model_ref) if isinstance(
+        model_ref, str) else model_ref
+    model = dict(document)
+    model["qubo"] = QUBOModel._from_store(
+        store, document["qubo"], document["qubo"]["prefix"])
+    return model
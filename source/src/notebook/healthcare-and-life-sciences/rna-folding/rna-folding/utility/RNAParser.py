@@ -15,6 +15,8 @@ import logging
 import pickle  # nosec
 import os
 
+from .DataStore import DataStore, save_store, is_store
+
 log = logging.getLogger()
 log.setLevel('INFO')
 
@@ -147,20 +149,66 @@ class RNAData():
 
     def save(self, version, path=None):
         self.save_path = None
-        save_name = f"rna-folding_data_{version}.pickle"
+        save_name = f"rna-folding_data_{version}"
 
         if path != None:
             self.save_path = os.path.join(path, save_name)
         else:
             self.save_path = os.path.join(".", save_name)
 
-        with open(self.save_path, "wb") as f:
-            pickle.dump(self, f)
+        meta, arrays = _rna_files_store_data(self.rna_files)
+        meta = {"rna_files": meta}
+        meta["folder"] = self.folder
+        meta["rna_name"] = self.rna_name
+        meta["save_path"] = self.save_path
+        save_store(self.save_path, "RNAData", meta, arrays)
         logging.info(f"finish save {save_name}")
 
         return self.save_path
 
     @classmethod
     def load(cls, filename):
+        if is_store(filename):
+            store = DataStore(filename, "RNAData")
+            rna_data = cls.__new__(cls)
+            rna_data.folder = store.meta["folder"]
+            rna_data.subdirectory = rna_data.folder + '/'
+            rna_data.rna_name = store.meta["rna_name"]
+            rna_data.save_path = store.meta["save_path"]
+            rna_data.rna_files = _rna_files_from_store(
+                store, store.meta["rna_files"])
+            return rna_data
+        # data saved as pickle by the previous versions
         with open(filename, "rb") as f:
             return pickle.load(f)  # nosec
+
+
+def _rna_files_store_data(rna_files, prefix=""):
+    # the stems as arrays, the rest of the rna files as json
+    meta = {}
+    arrays = {}
+    for n, (rna_name, rna_file) in enumerate(rna_files.items()):
+        stems_potential, mu, rna, rna_len = rna_file['potential_stems']
+        meta[rna_name] = {'fasta_file': rna_file['fasta_file'], 'ct_file': rna_file['ct_file'],
+                          'rna_strand': rna_file['rna_strand'], 'potential_stems': [mu, rna, rna_len],
+                          'actual_stems': rna_file['actual_stems'] is not None, 'prefix': f"{prefix}rna_{n}_"}
+        arrays[f"{prefix}rna_{n}_potential_stems"] = np.array(
+            stems_potential, dtype=np.int64).reshape((-1, 4))
+        if rna_file['actual_stems'] is not None:
+            arrays[f"{prefix}rna_{n}_actual_stems"] = np.array(
+                rna_file['actual_stems'], dtype=np.int64).reshape((-1, 3))
+    return meta, arrays
+
+
+def _rna_files_from_store(store, meta):
+    rna_files = {}
+    for rna_name, rna_meta in meta.items():
+        rna_files[rna_name] = {}
+        rna_files[rna_name]['fasta_file'] = rna_meta['fasta_file']
+        rna_files[rna_name]['ct_file'] = rna_meta['ct_file']
+        rna_files[rna_name]['rna_strand'] = rna_meta['rna_strand']
+        rna_files[rna_name]['potential_stems'] = [store.array(
+            f"{rna_meta['prefix']}potential_stems").tolist()] + rna_meta['potential_stems']
+        rna_files[rna_name]['actual_stems'] = store.array(
+            f"{rna_meta['prefix']}actual_stems").tolist() if rna_meta['actual_stems'] else None
+    return rna_files
@@ -4,17 +4,16 @@
 ########################################################################################################################
 #   The following class is the construction of QUBO model
 ########################################################################################################################
-import dimod
-
 import numpy as np
-from collections import defaultdict
 import time
 import logging
 import pickle  # nosec
 import os
 
-from .RNAParser import RNAData
+from .RNAParser import RNAData, _rna_files_store_data, _rna_files_from_store
 from .RNAGeoCalc import *
+from .QUBOModel import QUBOModel, _model_store_data, _load_model
+from .DataStore import DataStore, LazyStoreDict, save_store, is_store
 
 log = logging.getLogger()
 log.setLevel('INFO')
@@ -80,8 +79,9 @@ class RNAQUBO():
                         pks_p = potential_pseudoknots(stems_p[0], pkp_penalty)
                         ols_p = self._potential_overlaps(stems_p[0])
                         qubo_data = self._model(stems_p[0], pks_p, ols_p, stems_p[1])
-                        qubo_raw = dimod.BinaryQuadraticModel(qubo_data[0], qubo_data[1], vartype = 'BINARY')
-                        qubo = self._manual_qubo(qubo_raw.to_qubo())
+                        qubo_raw = {(var, var): bias for var, bias in qubo_data[0].items()}
+                        qubo_raw.update(qubo_data[1])
+                        qubo = QUBOModel.from_qubo(qubo_raw)
                         end = time.time()
 
                         self.models[rna_name]['model_qubo']["qc"][model_name] = {}
@@ -96,14 +96,6 @@ class RNAQUBO():
     #                 logging.info(
     #                     f"Construct model for PKP:{pkp_penalty},O:{overlap_penalty},S:{short_penalty} {(end-start)/60} min")
 
-    def _manual_qubo(self, qubo_raw):
-        qubo = defaultdict(float)
-
-        for key, value in qubo_raw[0].items():
-            qubo[key] = value
-
-        return qubo
-
     def describe_models(self):
 
         # information for model
@@ -128,23 +120,76 @@ class RNAQUBO():
     def save(self, version, path=None):
 
         save_path = None
-        save_name = f"rna_folding_{version}.pickle"
+        save_name = f"rna_folding_{version}"
 
         if path != None:
             save_path = os.path.join(path, save_name)
         else:
             save_path = os.path.join(".", save_name)
 
-        with open(save_path, "wb") as f:
-            pickle.dump(self, f)
+        meta = {}
+        meta["param"] = self.param
+        meta["data_path"] = self.data_path
+        meta["method"] = self.method
+        documents = {}
+        documents["rna_data"], arrays = _rna_files_store_data(
+            self.rna_data, "rna_data_")
+        # index of the models, each model is a document and its arrays
+        meta["models"] = {}
+        model_num = 0
+        for rna_name, models in self.models.items():
+            meta["models"][rna_name] = {
+                'model_info': models['model_info'], 'model_qubo': {}}
+            for method, method_models in models['model_qubo'].items():
+                meta["models"][rna_name]['model_qubo'][method] = {}
+                for model_name, model in method_models.items():
+                    ref = f"model_{model_num}"
+                    model_num = model_num + 1
+                    documents[ref], qubo_arrays = _model_store_data(
+                        model, ref)
+                    arrays.update(qubo_arrays)
+                    meta["models"][rna_name]['model_qubo'][method][model_name] = ref
+
+        save_store(save_path, "RNAQUBO", meta, arrays, documents)
         logging.info(f"finish save {save_name}")
         return save_path
 
     @classmethod
     def load(cls, filename):
+        if is_store(filename):
+            return cls._from_store(DataStore(filename, "RNAQUBO"))
+        # models saved as pickle by the previous versions
         with open(filename, "rb") as f:
             return pickle.load(f)  # nosec
 
+    @classmethod
+    def load_index(cls, filename):
+        # names of the saved models for each rna and method, read without loading the models
+        store = DataStore(filename, "RNAQUBO")
+        return {rna_name: {method: list(index.keys()) for method, index in models['model_qubo'].items()}
+                for rna_name, models in store.meta["models"].items()}
+
+    @classmethod
+    def _from_store(cls, store):
+        meta = store.meta
+
+        rna_qubo = cls.__new__(cls)
+        rna_qubo.param = meta["param"]
+        rna_qubo.data_path = meta["data_path"]
+        rna_qubo.method = meta["method"]
+        rna_meta = store.document(
+            "rna_data") if store.version >= 2 else meta["rna_data"]
+        rna_qubo.rna_data = _rna_files_from_store(store, rna_meta)
+        rna_qubo.models = {}
+        for rna_name, models in meta["models"].items():
+            rna_qubo.models[rna_name] = {}
+            rna_qubo.models[rna_name]['model_info'] = {method: {param: set(value) for param, value in info.items()}
+                                                       for method, info in models['model_info'].items()}
+            # the models are loaded by get_model
+            rna_qubo.models[rna_name]['model_qubo'] = {method: LazyStoreDict(store, index, _load_model)
+                                                       for method, index in models['model_qubo'].items()}
+        return rna_qubo
+
     # function to generate list of stem pairs that overlap:
 
     def _potential_overlaps(self, stems_potential):